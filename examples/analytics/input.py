@@ -14,7 +14,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import urllib2, sys
+import atexit, urllib2, sys
 from datetime import datetime
 import splunk.client, utils
 
@@ -28,6 +28,7 @@ APPLICATION_KEY = "application"
 EVENT_KEY = "event"
 DISTINCT_KEY = "distinct_id"
 EVENT_TERMINATOR = "\\r\\n-----end-event-----\\r\\n"
+EVENT_SEPARATOR = "\r\n-----end-event-----\r\n"
 PROPERTY_PREFIX = "analytics_prop__"
 
 class AnalyticsTracker:
@@ -48,6 +49,26 @@ class AnalyticsTracker:
             stanza.submit("CHARSET = UTF-8")
             stanza.submit("SHOULD_LINEMERGE = false")
 
+        # Events are sent in batches, separated by the event terminator
+        # so that they are broken apart again on the way in
+        self.submitter = self.splunk.indexes[self.index].batch_submitter(
+            sourcetype=ANALYTICS_SOURCETYPE, separator=EVENT_SEPARATOR)
+
+        # Send whatever is still buffered at exit, should the tracker not
+        # have been closed by then
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Sends any events still waiting to be sent. This is also done
+           when the tracker is used as a context manager, and at exit."""
+        self.submitter.close()
+
     @staticmethod
     def encode(props):
         encoded = " ";
@@ -81,7 +102,7 @@ class AnalyticsTracker:
 
         event += AnalyticsTracker.encode(props)
 
-        self.splunk.indexes[self.index].submit(event, sourcetype=ANALYTICS_SOURCETYPE)
+        self.submitter.submit(event)
 
 def main():
     usage = ""
@@ -92,6 +113,7 @@ def main():
     tracker = AnalyticsTracker("cli_app", splunk_opts.kwargs)
     
     #tracker.track("test_event", "abc123", foo="bar", bar="foo")
+    tracker.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -124,25 +124,17 @@ class AnalyticsRetriever:
 
         over_time = {}
         reader = results.ResultsReader(job.results())
-        for kind,result in reader:
-            if kind == results.RESULT:
-                # Get the time for this entry
-                time = result["_time"]
-                del result["_time"]
-
-                # The rest is in the form of [event/property]:count
-                # pairs, so we decode those
-                for key,count in result.iteritems():
-                    # Ignore internal ResultsReader properties
-                    if key.startswith("$"):
-                        continue
-
-                    entry = over_time.get(key, [])
+        # Apart from _time, the columns are [event/property] counts, which
+        # are read into integer arrays
+        for batch in reader.read_batches(schema={"_time": None}, default="l"):
+            times = batch.pop("_time")
+            for key,counts in batch.iteritems():
+                entry = over_time.setdefault(key, [])
+                for time,count in zip(times, counts):
                     entry.append({
-                        "count": int(count or 0),
+                        "count": count,
                         "time": time,
                     })
-                    over_time[key] = entry
 
         return over_time
 
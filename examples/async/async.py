@@ -25,6 +25,7 @@ import urllib
 from time import sleep
 
 import splunk.client
+from splunk.nonblocking import AsyncService, gather, Return
 from utils import parse, error
 
 # Placeholder for a specific implementation of `urllib2`,
@@ -40,17 +41,23 @@ def _spliturl(url):
 
 def main(argv):
     global urllib2
-    usage = "async.py <sync | async>"
+    usage = "async.py <sync | async | nonblocking>"
 
     # Parse the command line args.
     opts = parse(argv, {}, ".splunkrc")
 
-    # We have to see if we got either the "sync" or
-    # "async" command line arguments.
-    allowed_args = ["sync", "async"]
+    # We have to see if we got either the "sync", "async" or
+    # "nonblocking" command line arguments.
+    allowed_args = ["sync", "async", "nonblocking"]
     if len(opts.args) == 0 or opts.args[0] not in allowed_args:
         error("Must supply either of: %s" % allowed_args, 2)
 
+    # The non-blocking mode doesn't use a custom handler at all, so we
+    # run it separately.
+    if opts.args[0] == "nonblocking":
+        main_nonblocking(opts)
+        return
+
     # Note whether or not we are async.
     is_async = opts.args[0] == "async"
 
@@ -141,6 +148,34 @@ def main(argv):
     print "Elapsed Time: %s" % (newtime - oldtime)
     
 
+##### Non-blocking mode
+
+def main_nonblocking(opts):
+    # The non-blocking service runs all of its requests on a single event
+    # loop, so we need neither threads nor a coroutine library to have many
+    # of them in flight at once.
+    service = AsyncService(**opts.kwargs)
+    loop = service.loop
+    loop.run(service.login())
+
+    oldtime = datetime.datetime.now()
+
+    # Each search is a coroutine: a generator that yields operations and is
+    # resumed with their results once they complete. While one search is
+    # waiting on splunkd, the loop runs the others.
+    def do_search(query):
+        sid = yield service.create_job(query, exec_mode="blocking")
+        response = yield service.job_results(sid)
+        results = yield response.body.readall()
+        yield service.cancel_job(sid)
+        raise Return(results)
+
+    queries = ['search * | head 100'] * 22
+    loop.run(gather([loop.spawn(do_search(query)) for query in queries]))
+
+    newtime = datetime.datetime.now()
+    print "Elapsed Time: %s" % (newtime - oldtime)
+
 ##### Custom `urllib2`-based HTTP handler
 
 def request(url, message, **kwargs):
@@ -20,23 +20,45 @@ using a parameterized chunking mechanism.
 """
 
 # installation support files
+import bz2
+from collections import deque
 import sys
 import operator
+from Queue import Queue
+import tempfile
+import threading
 import time
 import os
+import zlib
+from zlib import crc32
 
 # splunk support files
 import splunk.binding as binding
 from splunk.binding import connect
+from splunk.executor import Executor
 from utils import parse
 
-# hidden file
+# hidden files
 RESTART_FILE = "./.export_restart_log"
+FOLLOW_FILE = "./.export_follow_log"
 OUTPUT_FILE = "./export.out"
 REQUEST_LIMIT = 100000
 OUTPUT_MODE = "xml"
 OUTPUT_MODES = ["csv", "xml", "json"]
 RETRY_LIMIT = 500
+READ_SIZE = 65536
+WORKERS = 1
+COMPRESS_MODES = ["gzip", "bz2"]
+COMPRESS_QUEUE = 64 # chunks waiting to be compressed
+DURATION = 10
+SIZE = 0
+RATE_WEIGHT = 0.3 # weight of the latest request in measured rates
+INTERVAL = 60
+LAG = 60
+SPAN = 3600
+
+# time downsampling ratio day:hour, hour:minute, minute:second
+DOWNSAMPLE = { 86400 : 3600, 3600 : 60, 60 : 1 }
 
 CLIRULES = {
    'index': {
@@ -79,6 +101,50 @@ CLIRULES = {
         'default': False,
         'help': "Restarts an existing export that was prematurely terminated"
     },
+   'duration': {
+        'flags': ["--duration"],
+        'default': DURATION,
+        'help': "Target seconds per request, 0 for none (default is %d)" \
+                % DURATION
+    },
+   'size': {
+        'flags': ["--size"],
+        'default': SIZE,
+        'help': "Target bytes per request, 0 for none (default is %d)" % SIZE
+    },
+   'compress': {
+        'flags': ["--compress"],
+        'default': None,
+        'help': "Compress the export, one of %s" % COMPRESS_MODES
+    },
+   'follow': {
+        'flags': ["--follow"],
+        'default': False,
+        'help': "Keep exporting events as they are indexed"
+    },
+   'interval': {
+        'flags': ["--interval"],
+        'default': INTERVAL,
+        'help': "Seconds between --follow exports, 0 to export once " \
+                "(default is %d)" % INTERVAL
+    },
+   'lag': {
+        'flags': ["--lag"],
+        'default': LAG,
+        'help': "Seconds --follow stays behind the index time, so that " \
+                "events being indexed aren't missed (default is %d)" % LAG
+    },
+   'span': {
+        'flags': ["--span"],
+        'default': SPAN,
+        'help': "Most seconds of index time per --follow request " \
+                "(default is %d)" % SPAN
+    },
+   'workers': {
+        'flags': ["--workers"],
+        'default': WORKERS,
+        'help': "Buckets to fetch concurrently (default is %d)" % WORKERS
+    },
 }
 
 def query(context, start, end, span, index):
@@ -127,9 +193,9 @@ def get_buckets(context, start, end, index, limit, span):
     """ generate an export to splunkd for the index
         elememnts within the given time range """
 
-    # time downsampling ratio day:hour, hour:minute, minute:second
-    # the initial time span is 1 day (86400 seconds) -- if the number
-    # of events is too large, break down the day into hours, repeat
+    # time downsampling ratio day:hour, hour:minute, minute:second, see
+    # DOWNSAMPLE. The initial time span is 1 day (86400 seconds) -- if the
+    # number of events is too large, break down the day into hours, repeat
     # as necessary to minutes and then to seconds.
     #
     # We do this to make a reasonable amount of data transfer for each
@@ -139,7 +205,6 @@ def get_buckets(context, start, end, index, limit, span):
     # also because splunk "snaps" events based on the span size, this
     # behavior requires span and start/end times to be fully in phase
     # (i.e. starttime modulo span == 0).
-    downsample = { 86400 : 3600, 3600 : 60, 60 : 1 }
 
     # trace/debug
     #print 'start=%d, end=%d, index=%s, maxevents=%d, timespan=%d' % \
@@ -172,7 +237,7 @@ def get_buckets(context, start, end, index, limit, span):
             # only split down to one second.
             if span > 1:
                 # get next smaller chunk.
-                newspan = downsample[span]
+                newspan = DOWNSAMPLE[span]
 
                 # make smaller buckets, recurse with smaller span.
                 endtime = estarttime + span
@@ -212,51 +277,140 @@ def normalize_export_buckets(options, context):
 
     return buckets
 
-def sanitize_restart_bucket_list(options, bucket_list):
-    """ clean up bucket list for an export already in progress """
+def read_journal(path=RESTART_FILE):
+    """ read the restart file, which is a journal of the exported buckets,
+        or the --follow watermark file, which has the same format, returns
+        its entries as (bucket, offset, checksum) tuples """
+
+    ## each entry is a line of the form: count,starttime,span,offset,crc
+    ## where offset is the size of the export file once the bucket was
+    ## written and crc is the crc32 of the bucket's data. Entries written by
+    ## older versions only have the bucket, their offset and crc are None.
+    entries = []
+    committed = 0
+    rfd = open(path, "rb")
+    for line in rfd:
+        # an entry without a newline was torn by a crash while being written
+        if not line.endswith("\n"):
+            break
+        fields = [int(field) for field in line[:-1].split(",")]
+        offset = checksum = None
+        if len(fields) == 5:
+            offset, checksum = fields[3], fields[4]
+        entries.append((tuple(fields[:3]), offset, checksum))
+        committed += len(line)
+    rfd.close()
 
-    sane = True
+    # drop a torn entry, so that new entries start on a line of their own.
+    if os.path.getsize(path) > committed:
+        rfd = open(path, "r+b")
+        rfd.truncate(committed)
+        rfd.close()
 
-    ## run through the entries we have already processed found in the restart
-    ## file and remove them from the live bucket list.
+    return entries
 
-    # read restart file into a new list.
-    rfd = open(RESTART_FILE, "r")
-    rslist = []
-    plist = []
-    for line in rfd:
-        line = line[:-1].split(",")
-        rslist.append((int(line[0]), int(line[1]), int(line[2])))
-    rfd.close()
+def sanitize_restart_bucket_list(options, context, bucket_list, entries):
+    """ clean up bucket list for an export already in progress """
 
-    for entry in rslist:
-        # throw away empty buckets, until a non-empty bucket.
-        while bucket_list[0][0] == 0:
-            bucket_list.pop(0)
+    sane = True
 
-        if bucket_list[0] != entry:
-            print "Warning: live list contains: %s, restart list contains: %s" \
-                 % (str(bucket_list[0]), str(rslist[0]))
+    ## requests are sized on the fly, so the buckets in the restart file
+    ## needn't match the live ones. Instead, everything up to the end of the
+    ## last processed bucket has been exported, so remove the live buckets
+    ## that end by then.
+    plist = []
+    end = None
+    for entry in entries:
+        bucket = entry[0]
+        if end is not None and bucket[1] < end:
+            print "Warning: restart list overlaps at: %s" % str(bucket)
             sane = False
+        end = bucket[1] + bucket[2]
 
         if options.kwargs['progress']:
-            print "restart skipping already handled bucket: %s" % str(entry)
+            print "restart skipping already handled bucket: %s" % str(bucket)
+
+        plist.append(bucket)
+
+    abl = deque(bucket_list)
+    while end is not None and len(abl) > 0:
+        (events, start, span) = abl[0]
+        if start >= end:
+            break
+        abl.popleft()
+        if start + span > end:
+            # the bucket was split on the fly, and only its first part was
+            # processed. Split it the same way, down to seconds if need be.
+            if span not in DOWNSAMPLE:
+                sane = False
+                break
+            abl.extendleft(reversed(get_buckets(context, start, start + span,
+                options.kwargs['index'], int(options.kwargs['limit']),
+                DOWNSAMPLE[span])))
+
+    return (plist, list(abl), sane)
+
+def truncate_export(options, entries):
+    """ truncate the export file to the end of the last committed bucket,
+        which is checked against its journaled checksum first """
+
+    offset = 0
+    start = 0
+    checksum = None
+    if len(entries) > 0:
+        offset, checksum = entries[-1][1:]
+        if len(entries) > 1:
+            start = entries[-2][1]
+
+    try:
+        efd = open(options.kwargs['output'], "r+b")
+    except IOError:
+        # nothing was committed, so nothing was lost.
+        return offset == 0
 
-        # append the buckets we have already processed.
-        plist.append(bucket_list.pop(0))
+    try:
+        efd.seek(0, 2)
+        if efd.tell() < offset:
+            return False
+
+        # an older entry doesn't record where the last bucket starts.
+        if checksum is not None and start is not None:
+            efd.seek(start)
+            crc = 0
+            remaining = offset - start
+            while remaining > 0:
+                chunk = efd.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    return False
+                crc = crc32(chunk, crc)
+                remaining -= len(chunk)
+            if crc & 0xffffffff != checksum:
+                return False
+
+        # anything past the last commit is from a bucket that didn't finish.
+        efd.truncate(offset)
+    finally:
+        efd.close()
 
-    return (plist, bucket_list, sane)
+    return True
 
-def validate_export(options, bucket_list):
+def validate_export(options, context, bucket_list):
     """ validate an existing export for consistency """
 
     # open restart file:
     # pbl is processed bucket list, abl is adjusted bucket list.
-    (pbl, abl, sane) = sanitize_restart_bucket_list(options, bucket_list)
+    entries = read_journal()
+    (pbl, abl, sane) = sanitize_restart_bucket_list(
+        options, context, bucket_list, entries)
     if not sane:
         print "Mismatch between restart and live event list"
         return ([], False)
 
+    # the journal records where the last committed bucket ends, so there is
+    # no need to look at the exported data to find out.
+    if len(entries) == 0 or entries[-1][1] is not None:
+        return (abl, truncate_export(options, entries))
+
     # open main export for reading
     try:
         efd = open(options.kwargs['output'], 'r')
@@ -357,104 +511,469 @@ def report_banner(bucket_list):
     print "Events exported: %d, requiring %d splunk fetches" % \
                                             (eventcount, requests)
 
+class BucketSizer(object):
+    """ sizes export requests to take about duration seconds, or transfer
+        about size bytes, based on the rates measured on earlier requests,
+        and never to exceed limit events """
+
+    def __init__(self, limit, duration=DURATION, size=SIZE):
+        self.limit = limit
+        self.duration = duration
+        self.size = size
+        self.event_rate = None # events per second
+        self.event_size = None # bytes per event
+
+    def observe(self, events, size, seconds):
+        """ update the rates with those of a finished request """
+        if events == 0:
+            return
+        event_size = float(size) / events
+        event_rate = events / max(seconds, 0.001)
+        if self.event_rate is None:
+            self.event_rate = event_rate
+            self.event_size = event_size
+        else:
+            self.event_rate += RATE_WEIGHT * (event_rate - self.event_rate)
+            self.event_size += RATE_WEIGHT * (event_size - self.event_size)
+
+    def target(self):
+        """ the number of events the next request should ask for, or None
+            until there are rates to size it by """
+        if self.event_rate is None and (self.duration > 0 or self.size > 0):
+            return None
+        targets = [self.limit]
+        if self.duration > 0 and self.event_rate is not None:
+            targets.append(self.duration * self.event_rate)
+        if self.size > 0 and self.event_size is not None:
+            targets.append(self.size / max(self.event_size, 1.0))
+        return max(1, int(min(targets)))
+
+def plan_request(options, context, sizer, buckets):
+    """ take the next request's worth of buckets off the front of the
+        buckets deque, returns the bucket to request, which covers them """
+
+    # until a request has been measured, buckets are requested as is.
+    target = sizer.target()
+    if target is None:
+        return buckets.popleft()
+
+    # split the first bucket while it's too large, down to seconds.
+    (events, start, span) = buckets.popleft()
+    while events > target and span in DOWNSAMPLE:
+        pieces = get_buckets(context, start, start + span,
+                             options.kwargs['index'], target,
+                             DOWNSAMPLE[span])
+        buckets.extendleft(reversed(
+            [piece for piece in pieces if piece[0] != 0]))
+        if len(buckets) == 0:
+            return None
+        (events, start, span) = buckets.popleft()
+
+    # merge following buckets while they fit, the empty time between them
+    # costs nothing to request.
+    end = start + span
+    while len(buckets) > 0 and events + buckets[0][0] <= target:
+        bucket = buckets.popleft()
+        events += bucket[0]
+        end = bucket[1] + bucket[2]
+
+    return (events, start, end - start)
+
+class CheckedFile(object):
+    """ an export file that keeps a crc32 of the data written since it was
+        last synced """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.crc = 0
+
+    def close(self):
+        self.fd.close()
+
+    def fileno(self):
+        return self.fd.fileno()
+
+    def flush(self):
+        self.fd.flush()
+
+    def sync(self):
+        """ flush the file to disk, returns its size and the crc32 of the
+            data written since the last sync """
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+        crc, self.crc = self.crc & 0xffffffff, 0
+        return (os.fstat(self.fd.fileno()).st_size, crc)
+
+    def write(self, data):
+        self.crc = crc32(data, self.crc)
+        self.fd.write(data)
+
+class CompressedFile(object):
+    """ an export file that compresses the data written to it on a worker
+        thread, as a separate gzip or bz2 member for each bucket, so that
+        bucket boundaries in the file remain member boundaries """
+
+    def __init__(self, fd, mode):
+        self.fd = fd
+        self.mode = mode
+        self.compressor = None
+        self.error = None
+        self.queue = Queue(COMPRESS_QUEUE)
+        self.synced = Queue(1)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.fd.close()
+        self.check()
+
+    def compress(self, data):
+        if self.compressor is None:
+            if self.mode == "gzip":
+                self.compressor = zlib.compressobj(
+                    zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                    16 + zlib.MAX_WBITS) # gzip framing
+            else:
+                self.compressor = bz2.BZ2Compressor()
+        data = self.compressor.compress(data)
+        if data:
+            self.fd.write(data)
+
+    def fileno(self):
+        return self.fd.fileno()
+
+    def flush(self):
+        pass # members are only ended by sync
+
+    def run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            try:
+                if data is self.synced:
+                    # end the member, then sync the underlying file.
+                    if self.compressor is not None:
+                        self.fd.write(self.compressor.flush())
+                        self.compressor = None
+                    self.synced.put(self.fd.sync())
+                elif self.error is None:
+                    self.compress(data)
+            except:
+                # keep draining the queue, so that writers don't block.
+                self.error = sys.exc_info()
+                if data is self.synced:
+                    self.synced.put(None)
+
+    def sync(self):
+        """ end the current member and flush the file to disk, returns its
+            size and the crc32 of the data written since the last sync """
+        self.check()
+        self.queue.put(self.synced)
+        result = self.synced.get()
+        self.check()
+        return result
+
+    def write(self, data):
+        self.check()
+        self.queue.put(data)
+
+def fetch_bucket(options, context, bucket, squery=None):
+    """ issue the export request for a bucket, or the given search,
+        returns the response or None if the retry limit was reached """
+
+    if squery is None:
+        # generate a search.
+        squery = "search * index=%s " % options.kwargs['index']
+        squery = squery + "timeformat=%s "
+
+        start = bucket[1]
+        quantum = bucket[2]
+
+        squery = squery + "starttime=%d " % start
+        squery = squery + "endtime=%d " % (start+quantum)
+
+    retry_count = 0
+    while True:
+        if options.kwargs['progress']:
+            print "PROCESSING BUCKET:------ %s" % str(bucket)
+
+        # issue query to splunkd
+        # count=0 overrides the maximum number of events
+        # returned (normally 50K) regardless of what the .conf
+        # file for splunkd says.
+        result = context.get('search/jobs/export',
+                         search=squery,
+                         output_mode=options.kwargs['omode'],
+                         count=0)
+                         #count=int(bucket[0])+1)
+
+        if result.status == 200:
+            return result
+
+        retry_count = retry_count + 1
+        if options.kwargs['progress']:
+            print "HTTP status: %d, sleep and retry..." % result.status
+
+        if retry_count > RETRY_LIMIT:
+            print "RETRY_LIMIT reached, halting export. you can"
+            print " resume the export at a later date using the"
+            print " --restart flag"
+            return None
+
+        time.sleep(10)
+
+def fetch_segment(options, context, bucket):
+    """ fetch a bucket into a temporary segment file, returns the file
+        positioned at its start and the time taken, or None if the fetch
+        failed """
+
+    started = time.time()
+    result = fetch_bucket(options, context, bucket)
+    if result is None:
+        return None
+    segment = tempfile.TemporaryFile()
+    while True:
+        chunk = result.body.read(READ_SIZE)
+        if not chunk:
+            break
+        segment.write(chunk)
+    segment.seek(0)
+    return (segment, time.time() - started)
+
+def write_bucket(options, stream, header):
+    """ stream an exported bucket to the export file, READ_SIZE bytes at a
+        time, returns whether the csv header has been written and the size
+        of the bucket """
+
+    fd = options.kwargs['fd']
+
+    # read up to the end of the first line, which gets special handling.
+    head = ""
+    while "\n" not in head:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        head += chunk
+    if len(head) == 0:
+        return (header, 0)
+    size = len(head)
+    index = head.find("\n") + 1
+    if index == 0:
+        index = len(head)
+    firstline = head[:index].rstrip("\r\n")
+    last = head[index:]
+
+    # special handling for each output mode
+    if options.kwargs['omode'] == "xml":
+        # for xml, always write the first line, which is just an XML
+        # signifier
+        fd.write(firstline)
+        fd.write("\n")
+    elif options.kwargs['omode'] == "csv":
+        # for csv, only print out the field specifier once
+        if not header:
+            fd.write(firstline)
+            fd.write("\n")
+            header = True
+    # for json, we never print out the first line which is always
+    # an empty/dangling bracket "["
+
+    # the rest of the bucket is copied through as is, read until the end
+    # of the stream, since the first read may have ended with the first
+    # line.
+    if last:
+        fd.write(last)
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        fd.write(chunk)
+        last = chunk
+
+    # make sure the next bucket starts on a new line.
+    if last and not last.endswith("\n"):
+        fd.write("\n")
+
+    fd.flush()
+    return (header, size)
+
+def commit_bucket(options, rfd, bucket):
+    """ record a bucket as exported in the restart file """
+
+    # the bucket's data must be on disk before the journal entry that
+    # refers to it, and the entry before the next bucket is written.
+    offset, checksum = options.kwargs['fd'].sync()
+    rfd.write("%d,%d,%d,%d,%d\n" % (bucket + (offset, checksum)))
+    rfd.flush()
+    os.fsync(rfd.fileno())
+
 def export(options, context, bucket_list):
     """ given the buckets, export the events """
 
-    header = False
+    # a restarted export already has its csv header.
+    header = os.fstat(options.kwargs['fd'].fileno()).st_size > 0
 
     report_banner(bucket_list)
 
     # (re)open restart file appending to the end if it exists.
     rfd = open(RESTART_FILE, "a")
 
+    sizer = BucketSizer(int(options.kwargs['limit']),
+                        float(options.kwargs['duration']),
+                        int(options.kwargs['size']))
+
+    # empty buckets need not be requested.
+    buckets = deque()
     for bucket in bucket_list:
         if bucket[0] == 0:
             if options.kwargs['progress']:
                 print "SKIPPING BUCKET:-------- %s" % str(bucket)
         else:
-            retry = True
-            retry_count = 0
-            while retry:
-                if options.kwargs['progress']:
-                    print "PROCESSING BUCKET:------ %s" % str(bucket)
-                # generate a search.
-                squery = "search * index=%s " % options.kwargs['index']
-                squery = squery + "timeformat=%s "
-
-                start = bucket[1]
-                quantum = bucket[2]
-
-                squery = squery + "starttime=%d " % start
-                squery = squery + "endtime=%d " % (start+quantum)
-    
-                # issue query to splunkd
-                # count=0 overrides the maximum number of events
-                # returned (normally 50K) regardless of what the .conf
-                # file for splunkd says. 
-                result = context.get('search/jobs/export', 
-                                 search=squery, 
-                                 output_mode=options.kwargs['omode'],
-                                 count=0)
-                                 #count=int(bucket[0])+1)
-
-                if result.status != 200:
-                    retry_count = retry_count + 1
-                    if options.kwargs['progress']:
-                        print "HTTP status: %d, sleep and retry..." % \
-                              result.status
-
-                    if retry_count > RETRY_LIMIT:
-                        print "RETRY_LIMIT reached, halting export. you can"
-                        print " resume the export at a later date using the"
-                        print " --restart flag"
-                        return False
-
-                    time.sleep(10)
-                else:
-                    retry = False
-
-            # write export file 
-            # N.B.: atomic writes in python don't seem to exist. In order
-            # *really* make this robust, we need to atomically write the 
-            # body of the event returned AND update the restart file and
-            # guarantee both committed.
-
-            # atomic write start
-
-            data = result.body.read()
-            data = data.splitlines()
-            if len(data) > 0:
-                firstline = data[0]
-                data.pop(0)
-
-                # special handling for each output mode
-                if options.kwargs['omode'] == "xml":
-                    # for xml, always write the first line, which is just an XML
-                    # signifier
-                    options.kwargs['fd'].write(firstline)
-                    options.kwargs['fd'].write("\n")
-                elif options.kwargs['omode'] == "csv":
-                    # for csv, only print out the field specifier once
-                    if not header:
-                        options.kwargs['fd'].write(firstline)
-                        options.kwargs['fd'].write("\n")
-                        header = True
-                # for json, we never print out the first line which is always
-                # an empty/dangling bracket "["
-
-                for line in data:
-                    options.kwargs['fd'].write(line)
-                    options.kwargs['fd'].write("\n")
-
-                options.kwargs['fd'].flush()
-
-            rfd.write(str(bucket).strip("(").strip(")").replace(" ",""))
-            rfd.write("\n")
-            rfd.flush()
-            # atomic write commit
+            buckets.append(bucket)
+
+    workers = int(options.kwargs['workers'])
+    if workers > 1:
+        return export_parallel(
+            options, context, sizer, buckets, rfd, workers, header)
+
+    while len(buckets) > 0:
+        bucket = plan_request(options, context, sizer, buckets)
+        if bucket is None:
+            break
+
+        started = time.time()
+        result = fetch_bucket(options, context, bucket)
+        if result is None:
+            return False
+
+        # write export file, then commit the bucket to the restart
+        # journal. A crash before the commit leaves a partial bucket at
+        # the end of the export file, which a restart truncates away.
+        (header, size) = write_bucket(options, result.body, header)
+        commit_bucket(options, rfd, bucket)
+        sizer.observe(bucket[0], size, time.time() - started)
+
+    return True
+
+def export_parallel(options, context, sizer, buckets, rfd, workers, header):
+    """ export the buckets, fetching up to workers of them concurrently
+        into temporary segment files, which are appended to the export
+        file, and committed to the restart file, in bucket order """
+
+    executor = Executor(workers)
+    pending = deque()
+    try:
+        while len(buckets) > 0 or len(pending) > 0:
+            # keep twice as many fetches queued as there are workers, so
+            # that a slow bucket doesn't leave the workers idle.
+            while len(buckets) > 0 and len(pending) < 2*workers:
+                bucket = plan_request(options, context, sizer, buckets)
+                if bucket is None:
+                    break
+                future = executor.submit(
+                    fetch_segment, options, context, bucket)
+                pending.append((bucket, future))
+            if len(pending) == 0:
+                break
+
+            bucket, future = pending.popleft()
+            fetched = future.result()
+            if fetched is None:
+                return False
+
+            (segment, seconds) = fetched
+            try:
+                (header, size) = write_bucket(options, segment, header)
+            finally:
+                segment.close()
+            commit_bucket(options, rfd, bucket)
+            sizer.observe(bucket[0], size, seconds)
+    finally:
+        for bucket, future in pending:
+            future.cancel()
+        executor.shutdown(False)
 
     return True
 
+def open_output(options, mode):
+    """ open the export file with the given mode, compressing what is
+        written to it if requested """
+
+    try:
+        fd = CheckedFile(open(options.kwargs['output'], mode + "b"))
+        if options.kwargs['compress'] is not None:
+            fd = CompressedFile(fd, options.kwargs['compress'])
+        options.kwargs['fd'] = fd
+    except IOError:
+        print "Failed to open output file %s w/ mode %s" % \
+                             (options.kwargs['output'], mode)
+        sys.exit(1)
+
+def follow(options, context):
+    """ export the events indexed since the previous export, every interval
+        seconds, until interrupted """
+
+    ## the follow file is the high-water mark: each export covers an
+    ## _indextime range, which is journaled like a bucket once it has been
+    ## written, so the next export starts where the last one ended. Ranges
+    ## end lag seconds in the past, so that events still being indexed are
+    ## left for the next export, and each range is exclusive of its end, so
+    ## that no event is exported twice. A range longer than span seconds,
+    ## eg: after a long pause, is exported span seconds at a time.
+    watermark = int(options.kwargs['start'])
+    mode = "w"
+    if os.path.exists(FOLLOW_FILE):
+        entries = read_journal(FOLLOW_FILE)
+        if len(entries) > 0:
+            if entries[-1][1] is None or not truncate_export(options, entries):
+                print "Failed to validate export, consistency check failed"
+                sys.exit(1)
+            watermark = entries[-1][0][1] + entries[-1][0][2]
+            mode = "a"
+    if watermark <= 0:
+        print "--follow needs a --starttime, the index time to start from"
+        sys.exit(1)
+    open_output(options, mode)
+
+    interval = int(options.kwargs['interval'])
+    lag = int(options.kwargs['lag'])
+    span = max(1, int(options.kwargs['span']))
+    header = os.fstat(options.kwargs['fd'].fileno()).st_size > 0
+    rfd = open(FOLLOW_FILE, "a")
+    try:
+        while True:
+            latest = int(time.time()) - lag
+            while latest > watermark:
+                end = min(latest, watermark + span)
+                squery = "search * index=%s timeformat=%%s " \
+                         "_index_earliest=%d _index_latest=%d " \
+                         "| where _indextime < %d" % \
+                         (options.kwargs['index'], watermark, end, end)
+                bucket = (0, watermark, end - watermark)
+                result = fetch_bucket(options, context, bucket, squery)
+                if result is None:
+                    return False
+                (header, size) = write_bucket(options, result.body, header)
+                commit_bucket(options, rfd, bucket)
+                watermark = end
+            if interval <= 0:
+                return True
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return True
+    finally:
+        rfd.close()
+        options.kwargs['fd'].close()
+
 def main():
     """ main entry """
 
@@ -467,6 +986,12 @@ def main():
               options.kwargs['omode'])
         sys.exit(1)
 
+    compress = options.kwargs['compress']
+    if compress is not None and compress not in COMPRESS_MODES:
+        print "compress must be one of %s, found %s" % (COMPRESS_MODES,
+              compress)
+        sys.exit(1)
+
     # minor sanity check on start/end time
     try:
         int(options.kwargs['start'])
@@ -478,10 +1003,33 @@ def main():
 
     connection = connect(**options.kwargs)
 
-    # get lower level context.
+    # get lower level context, with a connection per worker when fetching
+    # buckets concurrently.
+    handler = None
+    if int(options.kwargs['workers']) > 1:
+        handler = binding.pooled_handler(
+            maxsize=int(options.kwargs['workers']))
     context = binding.connect( host=connection.host, 
                                username=connection.username,
-                               password=connection.password)
+                               password=connection.password,
+                               handler=handler)
+
+    # a range export and an incremental export each keep their own
+    # journal, and don't share a directory, since they'd be likely to share
+    # an output file too.
+    following = options.kwargs['follow'] is not False
+    other = RESTART_FILE if following else FOLLOW_FILE
+    if os.path.exists(other):
+        print "Error: %s exists, from a %s export." % \
+              (other, "range" if following else "--follow")
+        print "       remove it, or run this export from another directory"
+        sys.exit(1)
+
+    # an incremental export resumes from its follow file, if any.
+    if following:
+        if follow(options, context) is not True:
+            sys.exit(1)
+        return
 
     # open restart file.
     rfd = None
@@ -518,7 +1066,7 @@ def main():
     # restart log we have so far.
     #
     if options.kwargs['restart'] is not False:
-        (bucket_list, sane) = validate_export(options, bucket_list)
+        (bucket_list, sane) = validate_export(options, context, bucket_list)
         if sane is False:
             print "Failed to validate export, consistency check failed"
             sys.exit(1)
@@ -529,15 +1077,12 @@ def main():
     if options.kwargs['restart'] is not False:
         mode = "a"
 
-    try:
-        options.kwargs['fd'] = open(options.kwargs['output'], mode)
-    except IOError:
-        print "Failed to open output file %s w/ mode %s" % \
-                             (options.kwargs['output'], mode)
-        sys.exit(1)
+    open_output(options, mode)
 
     # chunk through each bucket, and on success, remove the restart file.
-    if export(options, context, bucket_list) is True:
+    done = export(options, context, bucket_list)
+    options.kwargs['fd'].close()
+    if done is True:
         os.remove(RESTART_FILE)
 
 if __name__ == '__main__':
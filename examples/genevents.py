@@ -29,6 +29,11 @@ SPLUNK_PORT = 9002
 INGEST_TYPE = ["stream", "submit", "tcp"]
 
 RULES = {
+   'connections': {
+        'flags': ["--connections"],
+        'default': 1,
+        'help': "number of streams to write over when using stream ingest"
+    },
    'ingest': {
         'flags': ["--ingest"],
         'default': 'stream',
@@ -61,9 +66,13 @@ def feed_index(service, opts):
         print "Index %s not found" % indexname
         return
 
-    if itype in ["stream", "submit"]:
-        stream = index.attach()
-    else:
+    if itype == "stream":
+        connections = int(opts.kwargs['connections'])
+        if connections > 1:
+            stream = index.parallel_writer(connections)
+        else:
+            stream = index.stream_writer()
+    elif itype == "tcp":
         # create a tcp input if one doesn't exist
         input_host = opts.kwargs.get("inputhost", SPLUNK_HOST)
         input_port = int(opts.kwargs.get("inputport", SPLUNK_PORT))
@@ -97,6 +106,11 @@ def feed_index(service, opts):
         print "^C detected, last event written:"
         print lastevent
 
+    if itype == "stream":
+        stream.close()
+        print "sent %d bytes in %d sends, %d reconnects" % \
+              (stream.bytes, stream.sends, stream.reconnects)
+
 def main():
     usage = "usage: %prog [options] <command> [<args>]"
 
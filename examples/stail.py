@@ -21,7 +21,6 @@ from pprint import pprint
 import sys
 
 from splunk.client import connect
-import splunk.results as results
 
 import utils
 
@@ -36,20 +35,15 @@ def main():
     service = connect(**opts.kwargs)
 
     try:
-        result = service.get(
-            "search/jobs/export",
-            search=search,
+        stream = service.export(
+            search,
+            preview=True,
             earliest_time="rt", 
             latest_time="rt", 
             search_mode="realtime")
 
-        reader = results.ResultsReader(result.body)
-        while True:
-            kind = reader.read()
-            if kind == None: break
-            if kind == results.RESULT:
-                event = reader.value
-                pprint(event)
+        for event in stream:
+            pprint(event)
 
     except KeyboardInterrupt:
         print "\nInterrupted."
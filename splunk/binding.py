@@ -17,6 +17,9 @@
 import httplib
 import socket
 import ssl
+from StringIO import StringIO
+import threading
+import time
 import urllib
 
 from xml.etree.ElementTree import XML
@@ -26,14 +29,27 @@ from splunk.data import record
 __all__ = [
     "connect",
     "Context",
+    "ConnectionPool",
     "handler",
     "HTTPError",
+    "pooled_handler",
 ]
 
 DEFAULT_HOST = "localhost"
 DEFAULT_PORT = "8089"
 DEFAULT_SCHEME = "https"
 
+DEFAULT_POOL_SIZE = 10  # Max idle connections kept per (scheme, host, port)
+DEFAULT_POOL_IDLE = 10  # Seconds an idle connection may sit in the pool
+
+# Responses with a Content-Length up to this size are read eagerly by the
+# pooled handler so that their connection goes back to the pool right away.
+PRELOAD_LIMIT = 65536
+
+# Methods the pooled handler may safely send again after a pooled connection
+# fails once the request has gone out.
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
 # Construct an URL prefix from the given scheme, host and port.
 # kwargs: scheme, host, port
 def prefix(**kwargs):
@@ -236,36 +252,51 @@ class ResponseReader:
     def __str__(self):
         return self.read()
 
+    def close(self):
+        self._response.close()
+
     def read(self, size = None):
         return self._response.read(size)
 
+# Open an httplib connection to the given scheme, host and port.
+def open_connection(scheme, host, port, key_file=None, cert_file=None, 
+                    timeout=None):
+    kwargs = {}
+    if timeout is not None: kwargs['timeout'] = timeout
+    if scheme == "http":
+        return httplib.HTTPConnection(host, port, **kwargs)
+    if scheme == "https":
+        if key_file is not None: kwargs['key_file'] = key_file
+        if cert_file is not None: kwargs['cert_file'] = cert_file
+        return httplib.HTTPSConnection(host, port, **kwargs)
+    raise ValueError("unsupported scheme: %s" % scheme)
+
+# Build the (method, body, headers) triple for the given request message.
+def request_head(host, message):
+    body = message.get("body", "")
+    head = { 
+        "Content-Length": str(len(body)),
+        "Host": host,
+        "User-Agent": "splunk-sdk-python/0.1",
+        "Accept": "*/*",
+    } # defaults
+    for key, value in message["headers"]: 
+        head[key] = value
+    method = message.get("method", "GET")
+    return method, body, head
+
 # The default HTTP request handler.
 def handler(key_file=None, cert_file=None, timeout=None):
-    """Creates an HTTP request handler parameterized with the given args."""
+    """Creates an HTTP request handler parameterized with the given args,
+       which are available as the handler's 'options' attribute."""
 
     def connect(scheme, host, port):
-        kwargs = {}
-        if timeout is not None: kwargs['timeout'] = timeout
-        if scheme == "http":
-            return httplib.HTTPConnection(host, port, **kwargs)
-        if scheme == "https":
-            if key_file is not None: kwargs['key_file'] = key_file
-            if cert_file is not None: kwargs['cert_file'] = cert_file
-            return httplib.HTTPSConnection(host, port, **kwargs)
-        raise ValueError("unsupported scheme: %s" % scheme)
+        return open_connection(
+            scheme, host, port, key_file, cert_file, timeout)
 
     def request(url, message, **kwargs):
         scheme, host, port, path = spliturl(url)
-        body = message.get("body", "")
-        head = { 
-            "Content-Length": str(len(body)),
-            "Host": host,
-            "User-Agent": "splunk-sdk-python/0.1",
-            "Accept": "*/*",
-        } # defaults
-        for key, value in message["headers"]: 
-            head[key] = value
-        method = message.get("method", "GET")
+        method, body, head = request_head(host, message)
 
         connection = connect(scheme, host, port)
         try:
@@ -283,4 +314,177 @@ def handler(key_file=None, cert_file=None, timeout=None):
             "body": ResponseReader(response),
         }
 
+    request.options = {
+        'key_file': key_file, 'cert_file': cert_file, 'timeout': timeout }
+    return request
+
+# A thread safe pool of idle HTTP/1.1 keep-alive connections, keyed by
+# (scheme, host, port). The pool does not limit the number of connections
+# that may be open at once, it only bounds how many idle connections are
+# retained for reuse, and it closes connections that have been idle for
+# longer than idle_timeout secs, since the server will have dropped them
+# by then anyway.
+class ConnectionPool(object):
+    """A pool of reusable HTTP connections."""
+    def __init__(self, connect, maxsize=DEFAULT_POOL_SIZE, 
+                 idle_timeout=DEFAULT_POOL_IDLE):
+        self._connect = connect # Connection factory (scheme, host, port)
+        self._idle = {} # (scheme, host, port) => [(connection, time)*]
+        self._lock = threading.Lock()
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+
+    def __len__(self):
+        """Returns the number of idle connections held by the pool."""
+        self._lock.acquire()
+        try:
+            return sum([len(idle) for idle in self._idle.itervalues()])
+        finally:
+            self._lock.release()
+
+    # Remove expired connections from the given idle list (which must be
+    # called with the lock held) and return them so they can be closed
+    # outside of the lock.
+    def _expire(self, idle, now):
+        expired = [cn for cn, stamp in idle if now-stamp >= self.idle_timeout]
+        if len(expired) > 0:
+            idle[:] = [item for item in idle if now-item[1] < self.idle_timeout]
+        return expired
+
+    def acquire(self, scheme, host, port):
+        """Returns a (connection, reused) pair, where connection is either 
+           an idle connection to the given endpoint taken from the pool or
+           a newly created connection, and reused answers which it is."""
+        key = (scheme, host, port)
+        connection = None
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key, [])
+            expired = self._expire(idle, time.time())
+            if len(idle) > 0: 
+                connection = idle.pop()[0] # Most recently used
+        finally:
+            self._lock.release()
+        for item in expired: item.close()
+        if connection is not None: 
+            return connection, True
+        return self._connect(scheme, host, port), False
+
+    def clear(self):
+        """Closes all idle connections held by the pool."""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for items in idle.itervalues():
+            for connection, _ in items: connection.close()
+
+    def evict(self):
+        """Closes idle connections that have exceeded the idle timeout."""
+        now = time.time()
+        expired = []
+        self._lock.acquire()
+        try:
+            for idle in self._idle.itervalues():
+                expired.extend(self._expire(idle, now))
+        finally:
+            self._lock.release()
+        for connection in expired: connection.close()
+
+    def release(self, scheme, host, port, connection):
+        """Returns the given connection to the pool, closing it instead if 
+           the pool already holds maxsize idle connections to the endpoint."""
+        key = (scheme, host, port)
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(key, [])
+            pooled = len(idle) < self.maxsize
+            if pooled: idle.append((connection, time.time()))
+        finally:
+            self._lock.release()
+        if not pooled: connection.close()
+
+# A response reader that hands its connection back to the pool as soon as 
+# the response body has been completely read.
+class PooledResponseReader(ResponseReader):
+    def __init__(self, response, release):
+        ResponseReader.__init__(self, response)
+        self._release = release
+
+    # Abandon the rest of the response, since the connection can't be reused
+    # with unread data pending it is closed rather than returned to the pool.
+    def close(self):
+        if self._release is not None:
+            release, self._release = self._release, None
+            self._response.close()
+            release(True)
+
+    def read(self, size = None):
+        result = self._response.read(size)
+        if self._release is not None and self._response.isclosed():
+            release, self._release = self._release, None
+            release()
+        return result
+
+# An HTTP request handler that reuses keep-alive connections.
+def pooled_handler(key_file=None, cert_file=None, timeout=None,
+                   maxsize=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_POOL_IDLE):
+    """Creates an HTTP request handler that keeps connections alive and
+       reuses them across requests, parameterized with the given args. The
+       handler may be shared by contexts running on different threads, its
+       connection pool is available as the handler's 'pool' attribute and
+       its args as its 'options' attribute."""
+
+    def connect(scheme, host, port):
+        return open_connection(
+            scheme, host, port, key_file, cert_file, timeout)
+
+    pool = ConnectionPool(connect, maxsize, idle_timeout)
+
+    def request(url, message, **kwargs):
+        scheme, host, port, path = spliturl(url)
+        method, body, head = request_head(host, message)
+
+        while True:
+            connection, reused = pool.acquire(scheme, host, port)
+            sent = False
+            try:
+                connection.request(method, path, body, head)
+                sent = True
+                if timeout is not None: 
+                    connection.sock.settimeout(timeout)
+                response = connection.getresponse()
+                break
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                # The server may have closed a pooled connection while it
+                # sat idle, in which case we retry, eventually on a new one.
+                # Once a request has been sent the server may have acted on
+                # it, so only idempotent requests are sent again.
+                if not reused: raise
+                if sent and method not in IDEMPOTENT_METHODS: raise
+
+        def release(discard=False):
+            if discard or response.will_close:
+                connection.close()
+            else:
+                pool.release(scheme, host, port, connection)
+
+        if response.length is not None and response.length <= PRELOAD_LIMIT:
+            reader = ResponseReader(StringIO(response.read()))
+            release()
+        else:
+            reader = PooledResponseReader(response, release)
+
+        return {
+            "status": response.status, 
+            "reason": response.reason,
+            "headers": response.getheaders(),
+            "body": reader,
+        }
+
+    request.options = {
+        'key_file': key_file, 'cert_file': cert_file, 'timeout': timeout }
+    request.pool = pool
     return request
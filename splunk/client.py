@@ -20,7 +20,8 @@
 # caching resource state. From the perspective of this module, the 'policy'
 # for caching resource state belongs in the application or a higher level
 # framework, and its the purpose of this module to provide simplified
-# access to that resource state.
+# access to that resource state. An application that wants a simple policy
+# can opt-in to one by giving the Service a TTLCache, see below.
 #
 # A side note, the objects below that provide helper methods for updating eg:
 # Entity state, are written so that they may be used in a fluent style.
@@ -35,13 +36,25 @@
 #     collection. In Splunk collections, name and key are frequently the same
 #     but not always (eg: inputs).
 
-from time import sleep
+from calendar import timegm
+from collections import deque
+from copy import copy
+import heapq
+from Queue import Full, Queue
+import re
+import sys
+import threading
+from time import sleep, time
 from urllib import urlencode, quote_plus
 from urlparse import urlparse
+from zlib import crc32
 
-from splunk.binding import Context, HTTPError
+from splunk.binding import Context, HttpLib, HTTPError, pooled_handler
 import splunk.data as data
 from splunk.data import record
+from splunk.executor import CancelledError, DEFAULT_WORKERS, Executor
+from splunk.executor import Future, TimeoutError
+import splunk.results as results
 
 __all__ = [
     "connect",
@@ -61,6 +74,57 @@ PATH_ROLES = "authentication/roles/"
 PATH_STANZA = "configs/conf-%s/%s" # (file, stanza)
 PATH_USERS = "authentication/users/"
 
+DEFAULT_PAGE_SIZE = 10000 # Rows per page when paging through results
+DEFAULT_LIST_PAGE_SIZE = 100 # Entries per page when paging a collection
+
+# Default limits of a BatchSubmitter batch
+DEFAULT_BATCH_BYTES = 1024*1024
+DEFAULT_BATCH_EVENTS = 1000
+DEFAULT_BATCH_LATENCY = 1000 # Milliseconds
+
+# Defaults for StreamWriter
+DEFAULT_STREAM_BUFFER = 256*1024 # Bytes coalesced into each send
+DEFAULT_STREAM_QUEUE = 8         # Buffers waiting to be sent
+DEFAULT_STREAM_RETRIES = 3       # Reconnect attempts per buffer
+DEFAULT_STREAM_CONNECTIONS = 4   # Streams opened by a ParallelStreamWriter
+
+# Defaults for TTLCache
+DEFAULT_CACHE_SIZE = 1000 # Entries
+DEFAULT_CACHE_TTL = 30    # Seconds
+
+# Job states that Job.wait waits for by default
+JOB_FINISHED = ("DONE", "FAILED")
+
+# Polling intervals, in seconds, used when waiting on jobs. The interval
+# starts small, so that short searches return promptly, and grows by
+# POLL_FACTOR each time up to POLL_MAX.
+POLL_MIN = 0.05
+POLL_MAX = 2.0
+POLL_FACTOR = 1.5
+
+# Rows handed over at a time by each slice of a parallel search, and the
+# batches each slice of an ordered one may read ahead of the merge
+SLICE_BATCH = 64
+SLICE_QUEUE = 4
+
+# Timestamps as found in the _time field of results, in ISO 8601 form, or
+# in Splunk's default form, eg: 2009-08-08 01:13:31.000 PDT, whose zone name
+# is ignored since it doesn't give an offset
+TIME_PATTERN = re.compile(
+    r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(\.\d+)?"
+    r"\s*(Z|([+-])(\d\d):?(\d\d)|[A-Za-z]+)?$")
+
+# The output_time_format of the slices of an ordered parallel search, whose
+# epoch _time values merge exactly, whatever the server's time zone
+SLICE_TIME_FORMAT = "%s.%6N"
+
+# Results reader for each supported output_mode
+RESULTS_READERS = {
+    'csv': results.CSVResultsReader,
+    'json': results.JSONResultsReader,
+    'xml': results.ExpatResultsReader,
+}
+
 XNAMEF_ATOM = "{http://www.w3.org/2005/Atom}%s"
 XNAME_ENTRY = XNAMEF_ATOM % "entry"
 XNAME_CONTENT = XNAMEF_ATOM % "content"
@@ -80,10 +144,163 @@ def connect(**kwargs):
 def load(response, match=None):
     return data.load(response.body.read(), match)
 
+# An LRU ordered, size bounded cache of resource state whose entries expire
+# a number of seconds after they are stored. Entries are keyed by a
+# (kind, path) pair, where kind is one of 'entity', 'list' or 'itemmeta'.
+class TTLCache(object):
+    """A cache of resource state for use by a Service. Entries expire ttl
+       seconds after they are stored, or after ttls[kind] seconds, if given,
+       and the least recently used entries are evicted once the cache
+       holds maxsize entries."""
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL,
+                 ttls=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ttls = {} if ttls is None else ttls
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}  # key => [prev, next, key, value, expires]
+        self._root = []     # Sentinel of the circular recency list
+        self._root[:] = [self._root, self._root, None, None, None]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _unlink(self, entry):
+        prev, next = entry[0], entry[1]
+        prev[1] = next
+        next[0] = prev
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._root[:] = [self._root, self._root, None, None, None]
+        finally:
+            self._lock.release()
+
+    def get(self, key, default=None):
+        """Returns the unexpired value for the given key, or default."""
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key, None)
+            if entry is not None and entry[4] <= time():
+                self._unlink(entry)
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            # Move to the most recently used end of the list
+            self._unlink(entry)
+            last = self._root[0]
+            entry[0], entry[1] = last, self._root
+            last[1] = self._root[0] = entry
+            self.hits += 1
+            return entry[3]
+        finally:
+            self._lock.release()
+
+    def invalidate(self, path):
+        """Removes the entries at the given path, below it (eg: an entity's
+           children) and above it (eg: the list of its collection)."""
+        self._lock.acquire()
+        try:
+            for key in self._entries.keys():
+                kpath = key[1]
+                if kpath.startswith(path) or path.startswith(kpath):
+                    self._unlink(self._entries.pop(key))
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        """Stores the given value, evicting the least recently used entry
+           if the cache is full."""
+        ttl = self.ttls.get(key[0], self.ttl)
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is not None: self._unlink(entry)
+            if len(self._entries) >= self.maxsize:
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._entries[oldest[2]]
+            last = self._root[0]
+            entry = [last, self._root, key, value, time() + ttl]
+            last[1] = self._root[0] = entry
+            self._entries[key] = entry
+        finally:
+            self._lock.release()
+
+# Merge the given row iterators, each of which is in descending _time order,
+# into a single iterator over the rows in descending _time order.
+def _merge(streams):
+    def key(row):
+        value = row.get('_time', None)
+        return float("inf") if value is None else -_timestamp(value)
+    heap = []
+    for index, stream in enumerate(streams):
+        row = next(stream, None)
+        if row is not None: heap.append((key(row), index, row))
+    heapq.heapify(heap)
+    while len(heap) > 0:
+        _, index, row = heap[0]
+        yield row
+        row = next(streams[index], None)
+        if row is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(row), index, row))
+
+# Reads the rows of the given stream onto the given queue in batches of up
+# to SLICE_BATCH rows, as (batch, None) items, or (None, exc_info) if the
+# read fails, followed by (None, None). Gives up once closed is set.
+def _read_slice(stream, queue, closed):
+    def put(item):
+        while not closed.isSet():
+            try:
+                queue.put(item, True, POLL_MAX)
+                return
+            except Full:
+                pass
+    try:
+        batch = []
+        for row in stream:
+            batch.append(row)
+            if len(batch) == SLICE_BATCH:
+                put((batch, None))
+                batch = []
+        put((batch, None))
+    except:
+        put((None, sys.exc_info()))
+    put((None, None)) # Done
+
+# Returns the epoch time of the given _time value, which is either an epoch
+# time or a timestamp (see TIME_PATTERN). Timestamps with a zone name are
+# read as UTC, so they only compare with others in the same zone.
+def _timestamp(value):
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = TIME_PATTERN.match(value)
+    if match is None: raise ValueError("Invalid time: %s" % value)
+    parts = match.groups()
+    result = timegm([int(part) for part in parts[:6]])
+    if parts[6] is not None: result += float(parts[6])
+    if parts[8] is not None:
+        offset = 3600*int(parts[9]) + 60*int(parts[10])
+        result -= offset if parts[8] == "+" else -offset
+    return result
+
 class Service(Context):
     """The Splunk service."""
+    # kwargs: cache, and those of Context
     def __init__(self, **kwargs):
+        self.cache = kwargs.pop('cache', None)
         Context.__init__(self, **kwargs)
+        self._absent_kinds = set() # Input kinds that the service lacks
 
     @property
     def apps(self):
@@ -155,15 +372,148 @@ class Service(Context):
             dtor=lambda service, name:
                 service.delete(PATH_MESSAGES + name))
 
+    def cached(self, kind, path, fetch):
+        """Returns the cached value of the given kind for the given path,
+           calling fetch to get and cache the value when there is none."""
+        if self.cache is None: return fetch()
+        key = (kind, path)
+        value = self.cache.get(key, self.cache)
+        if value is self.cache: # Not cached
+            value = fetch()
+            self.cache.set(key, value)
+        return value
+
+    def delete(self, path, **kwargs):
+        try:
+            return Context.delete(self, path, **kwargs)
+        finally:
+            if self.cache is not None: self.cache.invalidate(path)
+
+    # kwargs: earliest_time, latest_time, search_mode, and the other
+    # search/jobs/export args
+    def export(self, query, output_mode="xml", preview=False, **kwargs):
+        """Runs the given search on the export endpoint and returns an
+           ExportStream over its result rows, which are streamed back as the
+           search produces them instead of being spooled to a job. Rows of
+           preview sections are skipped unless preview is True."""
+        response = self.get("search/jobs/export",
+            search=query, output_mode=output_mode, **kwargs)
+        return ExportStream(response.body, output_mode, preview)
+
     # kwargs: enable_lookups, reload_macros, parse_only, output_mode
     def parse(self, query, **kwargs):
         """Test a search query through the parser."""
         return self.get("search/parser", q=query, **kwargs)
 
+    def pooled(self, maxsize=DEFAULT_WORKERS):
+        """Returns the service itself if it already uses a pooled handler or
+           a custom one, otherwise a copy of it that shares its session and
+           cache, but sends requests over a pool of up to maxsize
+           keep-alive connections, opened with the handler's key_file,
+           cert_file and timeout."""
+        # Only the stock handler, which has options, is replaced
+        handler = self.http.handler
+        if hasattr(handler, 'pool') or not hasattr(handler, 'options'):
+            return self
+        service = copy(self)
+        service.http = HttpLib(
+            pooled_handler(maxsize=maxsize, **handler.options))
+        return service
+
+    def post(self, path, **kwargs):
+        try:
+            return Context.post(self, path, **kwargs)
+        finally:
+            if self.cache is not None: self.cache.invalidate(path)
+
+    def request(self, path, message):
+        try:
+            return Context.request(self, path, message)
+        finally:
+            if self.cache is not None: self.cache.invalidate(path)
+
     def restart(self):
         """Restart the service."""
         return self.get("server/control/restart")
 
+    # kwargs: output_mode, and the other search/jobs/export args
+    def search_parallel(self, query, earliest, latest,
+                        slices=DEFAULT_WORKERS, ordered=True, **kwargs):
+        """Runs the given search over the given range of epoch times split
+           into the given number of slices, each of which is run as a
+           concurrent export, and returns an iterator over the result rows.
+           If ordered, the rows are merged in descending _time order (the
+           order of a single search), and their _time values are epoch
+           times unless output_time_format is given, otherwise they are
+           yielded as soon as any slice produces them."""
+        if slices < 1: raise ValueError("slices must be >= 1")
+        step = (float(latest) - float(earliest)) / slices
+        bounds = [repr(float(earliest) + i*step) for i in range(slices)]
+        bounds.append(repr(float(latest)))
+        if ordered: kwargs.setdefault('output_time_format', SLICE_TIME_FORMAT)
+        service = self.pooled(slices)
+        streams = []
+        try:
+            for i in reversed(range(slices)): # Newest slice first
+                streams.append(service.export(query,
+                    earliest_time=bounds[i], latest_time=bounds[i+1],
+                    **kwargs))
+            if ordered:
+                rows = self._ordered(streams)
+            else:
+                rows = self._unordered(streams)
+            for row in rows: yield row
+        finally:
+            for stream in streams: stream.cancel()
+            if service is not self: service.http.handler.pool.clear()
+
+    # Read the given streams concurrently, each into a queue of its own
+    # holding up to SLICE_QUEUE batches, and merge their rows from those.
+    def _ordered(self, streams):
+        queues = [Queue(SLICE_QUEUE) for _ in streams]
+        closed = threading.Event()
+        def rows(queue):
+            while True:
+                batch, exc_info = queue.get()
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if batch is None: return
+                for row in batch: yield row
+        executor = Executor(len(streams))
+        try:
+            for stream, queue in zip(streams, queues):
+                executor.submit(_read_slice, stream, queue, closed)
+            for row in _merge([rows(queue) for queue in queues]): yield row
+            executor.shutdown() # Every slice is read, so this is prompt
+        finally:
+            closed.set()
+            for stream in streams: stream.cancel()
+            executor.shutdown(False)
+
+    # Read the given streams concurrently and yield their rows as they
+    # arrive, handed over in batches of up to SLICE_BATCH rows.
+    def _unordered(self, streams):
+        arrived = Queue(len(streams))
+        closed = threading.Event()
+        executor = Executor(len(streams))
+        try:
+            for stream in streams:
+                executor.submit(_read_slice, stream, arrived, closed)
+            remaining = len(streams)
+            while remaining > 0:
+                batch, exc_info = arrived.get()
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if batch is None:
+                    remaining -= 1
+                    continue
+                for row in batch: yield row
+            executor.shutdown() # Every slice is read, so this is prompt
+        finally:
+            closed.set()
+            for stream in streams: stream.cancel()
+            executor.shutdown(False)
+
     @property
     def roles(self):
         return Collection(self, PATH_ROLES, "roles",
@@ -222,12 +572,94 @@ class Collection(Endpoint):
         return self.item(self.service, key)
 
     def __iter__(self):
-        # Don't invoke __getitem__ below, we don't need the extra round-trip
-        # to validate that the key exists, because we just it from the list.
-        for name in self.list(): yield self.item(self.service, name)
+        return self.iter()
+
+    # Concurrently call each fn(service, name) of the given (name, fn) pairs
+    # and return a list of per item results, in order. A failing call
+    # doesn't abort the others, its error is recorded in its result.
+    def _bulk(self, calls, workers):
+        service = self.service.pooled(workers)
+        executor = Executor(workers)
+        try:
+            futures = [(name, executor.submit(fn, service, name))
+                       for name, fn in calls]
+            results = []
+            for name, future in futures:
+                error = future.exception()
+                results.append(record({
+                    'name': name,
+                    'ok': error is None,
+                    'value': future.result() if error is None else None,
+                    'error': error
+                }))
+            return results
+        finally:
+            executor.shutdown()
+            if service is not self.service: service.http.handler.pool.clear()
+
+    # Returns the key of the given loaded collection entry.
+    def _key(self, entry):
+        return entry.entry.title
+
+    def bulk(self, names, fn, workers=DEFAULT_WORKERS):
+        """Concurrently calls fn(item) on each of the named items, eg: to
+           enable or disable them, returning a list of results, with the
+           keys: name, ok, value (returned by fn) and error (if not ok)."""
+        if self.item is None: raise NotSupportedError
+        call = lambda service, name: fn(self.item(service, name))
+        return self._bulk([(name, call) for name in names], workers)
+
+    def bulk_create(self, items, workers=DEFAULT_WORKERS):
+        """Concurrently creates the given items, each of which is either a
+           name or a (name, kwargs) pair, or else given as a dict of name to
+           kwargs, returning a list of results (see bulk) whose values are
+           the created items."""
+        if self.ctor is None: raise NotSupportedError
+        if isinstance(items, dict): items = items.items()
+        def create(kwargs):
+            def call(service, name):
+                self.ctor(service, name, **kwargs)
+                if self.item is None: return None
+                return self.item(self.service, name)
+            return call
+        calls = []
+        for item in items:
+            name, kwargs = (item, {}) if isinstance(item, basestring) else item
+            calls.append((name, create(kwargs)))
+        return self._bulk(calls, workers)
+
+    def bulk_delete(self, names, workers=DEFAULT_WORKERS):
+        """Concurrently deletes the named items, returning a list of results
+           (see bulk)."""
+        if self.dtor is None: raise NotSupportedError
+        return self._bulk([(name, self.dtor) for name in names], workers)
+
+    def bulk_update(self, updates, workers=DEFAULT_WORKERS):
+        """Concurrently updates the items named by the keys of the given
+           dict with the corresponding kwargs, returning a list of results
+           (see bulk)."""
+        if self.item is None: raise NotSupportedError
+        def update(kwargs):
+            def call(service, name):
+                self.item(service, name).update(**kwargs)
+            return call
+        calls = [(name, update(kwargs)) for name, kwargs in updates.items()]
+        return self._bulk(calls, workers)
 
     def contains(self, name):
-        return name in self.list()
+        """Answers if the collection contains the given key, by reading the
+           item directly, through the service's cache, rather than listing
+           the collection."""
+        if not name: return False
+        if self.item is None: return name in self.list()
+        path = self.path + quote_plus(name) + "/"
+        try:
+            self.service.cached('entity', path,
+                lambda: load(self.service.get(path), MATCH_ENTRY_CONTENT))
+            return True
+        except HTTPError as e:
+            if e.status == 404: return False
+            raise
 
     def create(self, name, **kwargs):
         if self.ctor is None: raise NotSupportedError
@@ -241,21 +673,52 @@ class Collection(Endpoint):
 
     def itemmeta(self):
         """Returns metadata for members of the collection."""
-        response = self.get("/_new")
-        content = load(response, MATCH_ENTRY_CONTENT)
+        content = self.service.cached('itemmeta', self.path,
+            lambda: load(self.get("/_new"), MATCH_ENTRY_CONTENT))
         return record({
             'eai:acl': content['eai:acl'],
             'eai:attributes': content['eai:attributes']
         })
 
+    def iter(self, page_size=DEFAULT_LIST_PAGE_SIZE):
+        """Returns an iterator over the collection's items, which lists the
+           collection a page at a time, as the items are consumed."""
+        if self.item is None: raise NotSupportedError
+        offset = 0
+        while True:
+            response = self.get(count=page_size, offset=offset)
+            count = 0
+            for entry in data.iterload(response.body):
+                count += 1
+                # Don't invoke __getitem__ here, we don't need the extra
+                # round-trip to validate that the key exists, because we
+                # just got it from the list.
+                yield self.item(self.service, self._key(entry))
+            if count < page_size: break
+            offset += count
+
     def list(self):
         """Returns a list of collection keys."""
-        response = self.get(count=-1)
-        entry = load(response).feed.get('entry', None)
-        if entry is None: return []
-        if not isinstance(entry, list): 
-            entry = [entry]
-        return [item.title for item in entry]
+        def fetch():
+            response = self.get(count=-1)
+            entries = data.iterload(response.body)
+            return [self._key(entry) for entry in entries]
+        return list(self.service.cached('list', self.path, fetch))
+
+# Call the given function, which answers if polling is done, at a growing
+# interval until it is done, raising TimeoutError if it isn't done within the
+# given number of seconds.
+def _poll(done, timeout=None):
+    deadline = None if timeout is None else time() + timeout
+    interval = POLL_MIN
+    while not done():
+        secs = interval
+        if deadline is not None:
+            remaining = deadline - time()
+            if remaining <= 0: raise TimeoutError()
+            secs = min(secs, remaining)
+        sleep(secs)
+        interval = min(interval * POLL_FACTOR, POLL_MAX)
 
 def _filter_content(content, *args):
     if len(args) > 0: # We have filter args
@@ -293,9 +756,9 @@ class Entity(Endpoint):
     def read(self, *args):
         """Read and return the current entity value, optionally returning
            only the requested fields, if specified."""
-        response = self.get()
-        content = load(response, MATCH_ENTRY_CONTENT)
-        return _filter_content(content, *args)
+        content = self.service.cached('entity', self.path,
+            lambda: load(self.get(), MATCH_ENTRY_CONTENT))
+        return _filter_content(record(content), *args)
 
     def readmeta(self):
         """Return the entity's metadata."""
@@ -311,6 +774,419 @@ class Conf(Entity):
         message = { 'method': "POST", 'body': stanza }
         response = self.service.request(self.path, message)
 
+# Buffers events bound for an index and submits them from a background thread
+# as newline (or separator) joined batches, each sent as a single request.
+class BatchSubmitter(object):
+    """Submits events to an index in batches. A batch is sent once it holds
+       max_events events or max_bytes bytes, or its oldest event is
+       max_latency_ms old. Errors raised by sending a batch are re-raised
+       by the next call to submit, flush or close."""
+    def __init__(self, index, max_events=DEFAULT_BATCH_EVENTS,
+                 max_bytes=DEFAULT_BATCH_BYTES,
+                 max_latency_ms=DEFAULT_BATCH_LATENCY, separator="\n",
+                 **kwargs):
+        self.index = index
+        self.kwargs = kwargs # host, source, sourcetype
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency_ms / 1000.0
+        self.separator = separator
+        self.bytes = 0      # Bytes sent
+        self.events = 0     # Events sent
+        self.requests = 0   # Batches sent
+        self._buffer = []
+        self._size = 0      # Bytes buffered
+        self._since = None  # When the buffer was started
+        self._submitted = 0 # Events submitted
+        self._finished = 0  # Events sent, or dropped by a failed batch
+        self._flush = 0     # Events to send regardless of batch limits
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _check(self):
+        if self._error is not None: raise self._error
+
+    # Answers if a batch is due, otherwise returns the number of seconds
+    # until the buffered batch is due, or None if the buffer is empty.
+    def _due(self):
+        if len(self._buffer) == 0: return None
+        if len(self._buffer) >= self.max_events or \
+           self._size >= self.max_bytes or \
+           self._flush > self._finished or self._closed:
+            return True
+        remaining = self._since + self.max_latency - time()
+        return True if remaining <= 0 else remaining
+
+    def _run(self):
+        self._condition.acquire()
+        try:
+            while True:
+                due = self._due()
+                if due is not True:
+                    if due is None and self._closed: return
+                    self._condition.wait(due)
+                    continue
+                batch = self._take()
+                self._condition.release()
+                try:
+                    try:
+                        body = self.separator.join(batch)
+                        self.index.submit(body, **self.kwargs)
+                        error = None
+                    except Exception, e:
+                        error = e
+                finally:
+                    self._condition.acquire()
+                if error is None:
+                    self.bytes += len(body)
+                    self.events += len(batch)
+                    self.requests += 1
+                else:
+                    self._error = error
+                self._finished += len(batch)
+                self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    # Remove the next batch from the buffer, up to the batch limits.
+    def _take(self):
+        count, size = 0, 0
+        for event in self._buffer:
+            if count > 0 and (count == self.max_events or
+                              size + len(event) > self.max_bytes):
+                break
+            count += 1
+            size += len(event)
+        batch = self._buffer[:count]
+        del self._buffer[:count]
+        self._size -= size
+        self._since = time() if self._buffer else None
+        return batch
+
+    def close(self):
+        """Sends any buffered events and stops the background thread."""
+        self._condition.acquire()
+        try:
+            self._closed = True
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        self._thread.join()
+        self._check()
+
+    def flush(self):
+        """Sends all events submitted so far, waiting until they are sent."""
+        self._condition.acquire()
+        try:
+            target = self._submitted
+            self._flush = max(self._flush, target)
+            self._condition.notifyAll()
+            while self._finished < target:
+                self._condition.wait()
+            self._check()
+        finally:
+            self._condition.release()
+
+    def submit(self, event):
+        """Adds the given event to the current batch."""
+        self._condition.acquire()
+        try:
+            if self._closed: raise ValueError("Submitter is closed")
+            self._check()
+            self._buffer.append(event)
+            self._size += len(event)
+            self._submitted += 1
+            # Wake the sender to start timing a new batch, or when the batch
+            # is full
+            if len(self._buffer) == 1:
+                self._since = time()
+                self._condition.notifyAll()
+            elif len(self._buffer) >= self.max_events or \
+                 self._size >= self.max_bytes:
+                self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+# Coalesces writes to an attached index stream into large buffers, which are
+# handed to a sender thread through a bounded queue, so that a writer that
+# outpaces the connection blocks (backpressure) rather than buffering without
+# limit. The sender reattaches, with a fresh preamble, when a send fails.
+class StreamWriter(object):
+    """A buffered writer of events to an index stream (see Index.attach).
+       Each write is kept whole within a buffer, and a buffer whose send
+       fails is resent in full on a new stream, so events at the point of
+       failure may be delivered twice. An error that persists past the
+       retry limit fails the writer: the buffer that failed and any queued
+       after it are discarded, their size counted in dropped, and every
+       later call to write, flush or close re-raises the error. A writer
+       is meant to be used from a single thread."""
+    def __init__(self, index, buffer_size=DEFAULT_STREAM_BUFFER,
+                 queue_size=DEFAULT_STREAM_QUEUE,
+                 retries=DEFAULT_STREAM_RETRIES, **kwargs):
+        self.index = index
+        self.kwargs = kwargs # host, source, sourcetype
+        self.buffer_size = buffer_size
+        self.retries = retries
+        self.blocked = 0.0      # Seconds writers spent waiting on the queue
+        self.bytes = 0          # Bytes sent
+        self.dropped = 0        # Bytes discarded once the writer failed
+        self.reconnects = 0
+        self.sends = 0
+        self.writes = 0
+        self.started = time()
+        self._buffer = []
+        self._size = 0
+        self._queue = Queue(queue_size)
+        self._error = None
+        self._closed = False
+        self._stream = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _check(self):
+        if self._error is not None: raise self._error
+
+    # Queue the current buffer to be sent.
+    def _push(self):
+        if self._size == 0: return
+        data = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        if self._queue.full():
+            start = time()
+            self._queue.put(data)
+            self.blocked += time() - start
+        else:
+            self._queue.put(data)
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            try:
+                if data is None: break
+                if self._error is None:
+                    self._send(data)
+                else:
+                    self.dropped += len(data)
+            finally:
+                self._queue.task_done()
+        if self._stream is not None:
+            self._stream.close()
+
+    def _send(self, data):
+        attempt = 0
+        while True:
+            try:
+                if self._stream is None:
+                    self._stream = self.index.attach(**self.kwargs)
+                self._stream.sendall(data)
+                break
+            except Exception, e:
+                if self._stream is not None:
+                    self._stream.close()
+                    self._stream = None
+                if attempt == self.retries:
+                    self._error = e
+                    self.dropped += len(data)
+                    return
+                sleep(min(0.1 * 2**attempt, 5))
+                attempt += 1
+                self.reconnects += 1
+        self.bytes += len(data)
+        self.sends += 1
+
+    def close(self):
+        """Sends any buffered data and closes the stream."""
+        if self._closed: return
+        self._push()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._check()
+
+    def flush(self):
+        """Sends the data written so far, waiting until it is sent."""
+        self._push()
+        self._queue.join()
+        self._check()
+
+    @property
+    def queue_depth(self):
+        """The number of buffers waiting to be sent."""
+        return self._queue.qsize()
+
+    @property
+    def throughput(self):
+        """The average number of bytes sent per second."""
+        elapsed = time() - self.started
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def write(self, data):
+        """Writes the given data to the stream, which is sent once a full
+           buffer has accumulated."""
+        if self._closed: raise ValueError("Writer is closed")
+        self._check()
+        self._buffer.append(data)
+        self._size += len(data)
+        self.writes += 1
+        if self._size >= self.buffer_size: self._push()
+
+class ParallelStreamWriter(object):
+    """Writes events over several attached streams at once, each with its
+       own StreamWriter, and so its own bounded queue and sender thread.
+       The given connections are opened to each of the given indexes, which
+       may belong to different services (hosts). Events are distributed
+       round-robin, or by key when one is given, in which case all events
+       with the same key go to the same stream and keep their order."""
+    def __init__(self, indexes, connections=DEFAULT_STREAM_CONNECTIONS,
+                 **kwargs):
+        if not isinstance(indexes, list): indexes = [indexes]
+        self.writers = [
+            StreamWriter(index, **kwargs)
+            for index in indexes for i in range(connections)]
+        self._next = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _sum(self, name):
+        return sum([getattr(writer, name) for writer in self.writers])
+
+    @property
+    def blocked(self):
+        return self._sum('blocked')
+
+    @property
+    def bytes(self):
+        return self._sum('bytes')
+
+    @property
+    def dropped(self):
+        return self._sum('dropped')
+
+    def close(self):
+        """Closes all of the streams, re-raising the first error, if any."""
+        error = None
+        for writer in self.writers:
+            try:
+                writer.close()
+            except Exception, e:
+                if error is None: error = e
+        if error is not None: raise error
+
+    def flush(self):
+        """Sends the data written so far on all of the streams."""
+        for writer in self.writers: writer.flush()
+
+    @property
+    def queue_depth(self):
+        return self._sum('queue_depth')
+
+    @property
+    def reconnects(self):
+        return self._sum('reconnects')
+
+    @property
+    def sends(self):
+        return self._sum('sends')
+
+    @property
+    def throughput(self):
+        """The aggregate number of bytes sent per second."""
+        return self._sum('throughput')
+
+    def write(self, data, key=None):
+        """Writes the given data to the next stream, or to the stream for
+           the given key, eg: a host or source name."""
+        if key is None:
+            index = self._next
+            self._next = (index + 1) % len(self.writers)
+        else:
+            index = (crc32(key) & 0xffffffff) % len(self.writers)
+        self.writers[index].write(data)
+
+    @property
+    def writes(self):
+        return self._sum('writes')
+
+class ExportStream(object):
+    """An iterator over the result rows of an export search, which parses
+       the response as it is read, READ_SIZE bytes at a time, so memory use
+       is independent of the size of the export. The stream keeps count of
+       the rows it has yielded and the bytes it has read, and may be
+       cancelled part way, which closes the underlying connection."""
+    def __init__(self, body, output_mode="xml", preview=False):
+        self.body = body
+        self.bytes = 0
+        self.rows = 0
+        self._preview = preview
+        self._skipping = False  # In a preview section that is skipped?
+        self._cancelled = False
+        self._reader = RESULTS_READERS[output_mode](self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cancel()
+
+    def __iter__(self):
+        return self
+
+    def cancel(self):
+        """Stops the export, discarding any rows that have not been read."""
+        if self._cancelled: return
+        self._cancelled = True
+        self.body.close()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def next(self):
+        while not self._cancelled:
+            try:
+                kind, value = self._reader.next()
+            except StopIteration:
+                raise
+            except Exception:
+                # A cancel from another thread cuts the response short
+                if self._cancelled: break
+                raise
+            if kind == results.RESULTS:
+                self._skipping = not self._preview and \
+                    value.get('preview', "0") == "1"
+            elif kind == results.RESULT and not self._skipping:
+                self.rows += 1
+                return value
+        raise StopIteration()
+
+    # The stream interface read by the results reader
+    def read(self, size):
+        if self._cancelled: return ""
+        chunk = self.body.read(size)
+        self.bytes += len(chunk)
+        return chunk
+
 class Index(Entity):
     """Index class access to specific operations."""
     def __init__(self, service, name):
@@ -329,14 +1205,23 @@ class Index(Entity):
         # the connection open and use the Splunk extension headers to note
         # the input mode
         cn = self.service.connect()
-        cn.write("POST %s HTTP/1.1\r\n" % self.service.fullpath(path))
-        cn.write("Host: %s:%s\r\n" % (self.service.host, self.service.port))
-        cn.write("Accept-Encoding: identity\r\n")
-        cn.write("Authorization: %s\r\n" % self.service.token)
-        cn.write("X-Splunk-Input-Mode: Streaming\r\n")
-        cn.write("\r\n")
+        cn.sendall(
+            "POST %s HTTP/1.1\r\n" % self.service.fullpath(path) +
+            "Host: %s:%s\r\n" % (self.service.host, self.service.port) +
+            "Accept-Encoding: identity\r\n" +
+            "Authorization: %s\r\n" % self.service.token +
+            "X-Splunk-Input-Mode: Streaming\r\n" +
+            "\r\n")
         return cn
 
+    def batch_submitter(self, max_events=DEFAULT_BATCH_EVENTS,
+                        max_bytes=DEFAULT_BATCH_BYTES,
+                        max_latency_ms=DEFAULT_BATCH_LATENCY, **kwargs):
+        """Returns a BatchSubmitter that submits events to the index in
+           batches. kwargs: host, source, sourcetype, separator."""
+        return BatchSubmitter(self, max_events, max_bytes, max_latency_ms,
+                              **kwargs)
+
     def clean(self):
         """Delete the contents of the index."""
         saved = self.read('maxTotalDataSizeMB', 'frozenTimePeriodInSecs')
@@ -347,6 +1232,19 @@ class Index(Entity):
             if self['totalEventCount'] == '0': break
         self.update(**saved)
 
+    def parallel_writer(self, connections=DEFAULT_STREAM_CONNECTIONS,
+                        **kwargs):
+        """Returns a ParallelStreamWriter that writes events to the index
+           over the given number of attached streams. kwargs: host, source,
+           sourcetype, buffer_size, queue_size, retries."""
+        return ParallelStreamWriter(self, connections, **kwargs)
+
+    def stream_writer(self, buffer_size=DEFAULT_STREAM_BUFFER,
+                      queue_size=DEFAULT_STREAM_QUEUE, **kwargs):
+        """Returns a StreamWriter that writes events to the index through
+           an attached stream. kwargs: host, source, sourcetype, retries."""
+        return StreamWriter(self, buffer_size, queue_size, **kwargs)
+
     def submit(self, event, host=None, source=None, sourcetype=None):
         """Submits an event to the index via HTTP POST."""
         args = { 'index': self.name }
@@ -397,11 +1295,12 @@ INPUT_KINDMAP = {
 # each item is tagged with a kind.
 class Inputs(Endpoint):
     """A collection of Splunk inputs."""
-    def __init__(self, service, kindmap=None):
+    def __init__(self, service, kindmap=None, workers=DEFAULT_WORKERS):
         Endpoint.__init__(self, service, PATH_INPUTS)
         if kindmap is None: kindmap = INPUT_KINDMAP
         self._kindmap = kindmap
-        self._infos = None
+        self._infos = {}
+        self._workers = workers
         self.refresh()
         
     # args: kind*
@@ -426,12 +1325,14 @@ class Inputs(Endpoint):
     def create(self, kind, name, **kwargs):
         """Creates an input of the given kind, with the given name & args."""
         response = self.post(self._kindmap[kind], name=name, **kwargs)
-        return self.refresh()[self.itemkey(kind, name)]
+        self.service._absent_kinds.discard(kind)
+        return self.refresh(kind)[self.itemkey(kind, name)]
 
     def delete(self, key):
         """Deletes the input with the given key."""
-        response = self.service.delete(self._infos[key]['path'])
-        self.refresh()
+        info = self._infos[key]
+        response = self.service.delete(info['path'])
+        self.refresh(info['kind'])
         return self
 
     def itemkey(self, kind, name):
@@ -464,36 +1365,60 @@ class Inputs(Endpoint):
         if len(args) == 0: return self._infos.keys()
         return [k for k, v in self._infos.iteritems() if v['kind'] in args]
 
-    # Refreshes the 
-    def refresh(self):
-        """Refreshes the internal directory of entities and entity metadata."""
-        self._infos = {}
-        for kind in self.kinds:
+    # Read the entries of the given kind, returning None if the service
+    # doesn't have the kind.
+    def _read_kind(self, kind):
+        try:
+            response = self.service.get(self.kindpath(kind), count=-1)
+        except HTTPError as e:
+            if e.status == 404: return None # Nothing of this kind
+            raise
+        return list(data.iterload(response.body))
 
-            response = None
-            try:
-                response = self.service.get(self.kindpath(kind), count=-1)
-            except HTTPError as e:
-                if e.status == 404: 
-                    continue # Nothing of this kind
-                else: 
-                    raise
-                
-            entry = load(response).feed.get('entry', None)
-            if entry is None: continue
-            if not isinstance(entry, list): entry = [entry]
-            for item in entry:
-                name = item.title
-                key = self.itemkey(kind, name)
-                path = urlparse(item.id).path
-                links = dict([(link.rel, link.href) for link in item.link])
-                self._infos[key] = {
-                    'key': key,
-                    'kind': kind,
-                    'name': name,
-                    'path': path,
-                    'links': links,
-                }
+    # args: kind*
+    def refresh(self, *args):
+        """Refreshes the internal directory of entities and entity metadata,
+           optionally only for the given kinds. The kinds are read
+           concurrently, and kinds the service doesn't have are remembered
+           and skipped until reset is called."""
+        kinds = self.kinds if len(args) == 0 else args
+        for key, info in self._infos.items():
+            if info['kind'] in kinds: del self._infos[key]
+        absent = self.service._absent_kinds
+        kinds = [kind for kind in kinds if kind not in absent]
+        if len(kinds) == 0: return self
+        executor = Executor(min(self._workers, len(kinds)))
+        try:
+            futures = [executor.submit(self._read_kind, kind)
+                       for kind in kinds]
+            for kind, future in zip(kinds, futures):
+                entries = future.result()
+                if entries is None:
+                    absent.add(kind)
+                    continue
+                for entry in entries:
+                    item = entry.entry
+                    name = item.title
+                    key = self.itemkey(kind, name)
+                    path = urlparse(item.id).path
+                    links = item.link
+                    if not isinstance(links, list): links = [links]
+                    links = dict([(link.rel, link.href) for link in links])
+                    self._infos[key] = {
+                        'key': key,
+                        'kind': kind,
+                        'name': name,
+                        'path': path,
+                        'links': links,
+                    }
+        finally:
+            executor.shutdown(False)
+        return self
+
+    def reset(self):
+        """Forgets which kinds the service doesn't have, so that they are
+           read again by the next refresh."""
+        self.service._absent_kinds.clear()
         return self
 
 # The Splunk Job is not an enity, but we are able to make the interface look
@@ -529,6 +1454,68 @@ class Job(Endpoint):
         self.post("control", action="finalize")
         return self
 
+    def fetch_all(self, workers=DEFAULT_WORKERS, page_size=DEFAULT_PAGE_SIZE,
+                  ordered=True, **kwargs):
+        """Returns an iterator over the result rows of a finished job, which
+           are fetched and parsed as disjoint pages by the given number of
+           workers, over pooled keep-alive connections unless the service
+           has a custom handler, which is used as is. Rows are returned in
+           their original order, unless ordered is False in which case
+           each page is returned as soon as it arrives."""
+        service = self.service.pooled(workers)
+        try:
+            for row in self._pages(
+                service.http, workers, 2*workers, page_size, ordered, kwargs):
+                yield row
+        finally:
+            if service is not self.service: service.http.handler.pool.clear()
+
+    def iter_results(self, page_size=DEFAULT_PAGE_SIZE, prefetch=1,
+                     **kwargs):
+        """Returns an iterator over the result rows of a finished job. The
+           results are fetched a page at a time and up to prefetch pages
+           are fetched and parsed in the background while the current page
+           is being consumed."""
+        return self._pages(self.service.http,
+            max(1, prefetch), prefetch + 1, page_size, True, kwargs)
+
+    # Fetch and parse the pages of the job's results on the given number of
+    # workers, with at most window pages outstanding, and yield their rows.
+    def _pages(self, http, workers, window, page_size, ordered, kwargs):
+        count = int(self['resultCount'])
+        offsets = iter(xrange(0, count, page_size))
+        url = self.service.url(self.path + "results")
+        headers = self.service._headers()
+        def fetch(offset):
+            body = http.get(url, list(headers),
+                offset=offset, count=page_size, **kwargs).body
+            return self._parse_results(body, kwargs)
+        executor = Executor(workers)
+        pending = deque()
+        arrived = Queue()
+        try:
+            while True:
+                while len(pending) < window:
+                    offset = next(offsets, None)
+                    if offset is None: break
+                    future = executor.submit(fetch, offset)
+                    if not ordered: future.add_done_callback(arrived.put)
+                    pending.append(future)
+                if len(pending) == 0: break
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    future = arrived.get()
+                    pending.remove(future)
+                for row in future.result(): yield row
+        finally:
+            for future in pending: future.cancel()
+            executor.shutdown(False)
+
+    def _parse_results(self, body, kwargs):
+        reader = RESULTS_READERS[kwargs.get('output_mode', "xml")](body)
+        return [value for kind, value in reader if kind == results.RESULT]
+
     def pause(self):
         self.post("control", action="pause")
         return self
@@ -541,6 +1528,12 @@ class Job(Endpoint):
         content = load(response).entry.content
         return _filter_content(content, *args)
 
+    def read_results(self, offset, count, **kwargs):
+        """Returns the list of result rows in the given range, parsed using
+           the reader for the requested output_mode."""
+        body = self.results(offset=offset, count=count, **kwargs)
+        return self._parse_results(body, kwargs)
+
     def results(self, **kwargs):
         return self.get("results", **kwargs).body
 
@@ -568,12 +1561,22 @@ class Job(Endpoint):
         self.post("control", action="unpause")
         return self
 
+    def wait(self, timeout=None, until=JOB_FINISHED):
+        """Waits until the job's dispatchState is one of the given states,
+           polling at a growing interval, and raises TimeoutError if it
+           isn't within timeout seconds."""
+        _poll(lambda: self['dispatchState'] in until, timeout)
+        return self
+
 class Jobs(Collection):
     """A collection of search jobs."""
     def __init__(self, service):
         Collection.__init__(self, service, PATH_JOBS, "jobs",
             item=lambda service, sid: Job(service, sid))
 
+    def _key(self, entry):
+        return entry.entry.content.sid
+
     def create(self, query, **kwargs):
         response = self.post(search=query, **kwargs)
 
@@ -585,10 +1588,163 @@ class Jobs(Collection):
 
     def list(self):
         response = self.get()
-        entry = load(response, MATCH_ENTRY_CONTENT)
-        if entry is None: return []
-        if not isinstance(entry, list): entry = [entry]
-        return [item.sid for item in entry]
+        return [self._key(entry) for entry in data.iterload(response.body)]
+
+    def states(self):
+        """Returns a dict of the dispatchState of every job, keyed by sid,
+           read with a single listing of the jobs."""
+        response = self.get(count=0)
+        result = {}
+        for entry in data.iterload(response.body):
+            content = entry.entry.content
+            result[content.sid] = content.dispatchState
+        return result
+
+    def wait_all(self, jobs, timeout=None, until=JOB_FINISHED):
+        """Waits until all of the given jobs (or sids) are in one of the
+           given states, like Job.wait, but reads the state of all the jobs
+           with a single listing per poll, and returns their states keyed
+           by sid. A job that no longer exists is returned as FAILED."""
+        sids = set([getattr(job, 'sid', job) for job in jobs])
+        finished = {}
+        def done():
+            states = self.states()
+            for sid in list(sids):
+                # A job missing from the listing is read on its own
+                state = states.get(sid, None)
+                if state is None:
+                    try:
+                        state = Job(self.service, sid)['dispatchState']
+                    except HTTPError as e:
+                        if e.status != 404: raise
+                        # The job is gone (eg: expired or deleted), so it
+                        # won't reach any state, and its results are lost
+                        finished[sid] = "FAILED"
+                        sids.remove(sid)
+                        continue
+                if state in until:
+                    finished[sid] = state
+                    sids.remove(sid)
+            return len(sids) == 0
+        _poll(done, timeout)
+        return finished
+
+# Admission control for searches: submitted searches wait in a priority
+# queue and a fixed number of dispatcher threads each run one job at a time,
+# so no more than max_concurrent jobs are ever running on the server.
+class JobPool(object):
+    """Runs submitted searches with at most max_concurrent jobs running at
+       once, highest priority first (and in submission order within a
+       priority). Each submission returns a Future that resolves, once its
+       job is done, to an iterator over the job's results (see
+       Job.iter_results). The job itself is available as the future's job
+       attribute once it is created."""
+    def __init__(self, service, max_concurrent=DEFAULT_WORKERS):
+        self.service = service
+        self.max_concurrent = max_concurrent
+        self._condition = threading.Condition()
+        self._queue = [] # Heap of (-priority, seq, future, query, kwargs)
+        self._seq = 0
+        self._running = set()   # Jobs currently running
+        self._shutdown = False
+        self._cancel = False
+        self._threads = []
+        for i in range(max_concurrent):
+            thread = threading.Thread(target=self._dispatch)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def _dispatch(self):
+        while True:
+            self._condition.acquire()
+            try:
+                while len(self._queue) == 0 and not self._shutdown:
+                    self._condition.wait()
+                if len(self._queue) == 0: return
+                _, _, future, query, kwargs = heapq.heappop(self._queue)
+            finally:
+                self._condition.release()
+            if future.set_running():
+                self._run(future, query, kwargs)
+
+    def _run(self, future, query, kwargs):
+        job = None
+        try:
+            job = self.service.jobs.create(query, **kwargs)
+            future.job = job
+            self._condition.acquire()
+            try:
+                if self._cancel: raise CancelledError()
+                self._running.add(job)
+            finally:
+                self._condition.release()
+            _poll(lambda: self._cancel or job['dispatchState'] in JOB_FINISHED)
+            if self._cancel: raise CancelledError()
+            if job['dispatchState'] == "FAILED":
+                raise SplunkError("Search job %s failed" % job.sid)
+            future.set_result(job.iter_results())
+        except:
+            if self._cancel:
+                if job is not None: self._try_cancel(job)
+                future.set_exception((CancelledError, CancelledError(), None))
+            else:
+                future.set_exception()
+        finally:
+            self._condition.acquire()
+            self._running.discard(job)
+            self._condition.release()
+
+    def _try_cancel(self, job):
+        try:
+            job.cancel()
+        except HTTPError:
+            pass # Already gone
+
+    def shutdown(self, cancel=True, wait=True):
+        """Stops the pool. If cancel is True, queued searches are cancelled
+           and running jobs are cancelled on the server, otherwise the
+           searches already submitted are run to completion."""
+        self._condition.acquire()
+        try:
+            self._shutdown = True
+            if cancel:
+                self._cancel = True
+                queued, self._queue = self._queue, []
+                running = list(self._running)
+            else:
+                queued, running = [], []
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        for item in queued: item[2].cancel()
+        for job in running: self._try_cancel(job)
+        if wait:
+            for thread in self._threads: thread.join()
+
+    def submit(self, query, priority=0, **kwargs):
+        """Queues the given search, with the given priority (higher runs
+           first), returning a Future of its results. kwargs are passed to
+           Jobs.create."""
+        future = Future()
+        future.job = None
+        self._condition.acquire()
+        try:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit after shutdown")
+            heapq.heappush(
+                self._queue, (-priority, self._seq, future, query, kwargs))
+            self._seq += 1
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        return future
 
 class Message(Entity):
     def __init__(self, service, name):
@@ -16,8 +16,12 @@
 
 import sys
 from xml.etree.ElementTree import XML
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
 
-__all__ = ["load"]
+__all__ = ["iterload", "load"]
 
 LNAME_DICT = "dict"
 LNAME_ITEM = "item"
@@ -52,6 +56,44 @@ def localname(xname):
     rcurly = xname.find('}')
     return xname if rcurly == -1 else xname[rcurly+1:]
 
+# Wraps a stream, noting whether anything but whitespace has been read.
+class _BlankReader(object):
+    def __init__(self, stream):
+        self.stream = stream
+        self.blank = True
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if self.blank and data.strip(): self.blank = False
+        return data
+
+def iterload(stream, match="entry"):
+    """Incrementally load the given XML stream, yielding the Python structure
+       of each element whose tag matches the given match string, one at a 
+       time, as they are parsed. The match string is either a local or an
+       extended tag name. Matched elements are discarded once loaded, so 
+       memory use doesn't grow with the size of the stream."""
+    nametable = {
+        'namespaces': [],
+        'names': {}
+    }
+    path = [] # The open elements
+    reader = _BlankReader(stream)
+    try:
+        for event, element in iterparse(reader, events=("start", "end")):
+            if event == "start":
+                path.append(element)
+                continue
+            path.pop()
+            if element.tag != match and localname(element.tag) != match:
+                continue
+            yield load_root(element, nametable)
+            element.clear()
+            if len(path) > 0: path[-1].remove(element)
+    except SyntaxError:
+        # An empty stream loads as nothing, just like load
+        if not reader.blank: raise
+
 def load(text, match=None):
     """Load the given XML text into a Python structure, optionally loading 
        only the matching sub-elements if a match string is given. The match
@@ -0,0 +1,250 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+#
+# This module provides a small, bounded pool of worker threads that runs
+# callables in the background and hands back a Future for each of them. It is
+# used by the client layer to overlap requests to splunkd, for example to
+# read ahead the next page of a job's results while the current page is
+# being consumed.
+#
+
+"""A bounded thread pool executor and futures."""
+
+import atexit
+from Queue import Queue
+import sys
+import threading
+import time
+from weakref import WeakKeyDictionary
+
+__all__ = [
+    "CancelledError",
+    "Executor",
+    "Future",
+    "TimeoutError"
+]
+
+DEFAULT_WORKERS = 4
+
+# Executors with live workers, which are told to shut down at exit. They
+# are not joined, since a call that hangs (eg: on a dead connection) would
+# then block the interpreter from exiting, and the workers are daemon
+# threads that don't keep it alive.
+executors = WeakKeyDictionary()
+
+def shutdown_all():
+    for executor in executors.keys(): executor.shutdown(wait=False)
+
+atexit.register(shutdown_all)
+
+class CancelledError(Exception):
+    pass
+
+class TimeoutError(Exception):
+    pass
+
+class Future(object):
+    """The eventual result of a callable submitted to an Executor."""
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = "pending" # pending, running, cancelled or done
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def _complete(self, value, exc_info):
+        self._condition.acquire()
+        try:
+            if self._state == "cancelled": return
+            self._result = value
+            self._exc_info = exc_info
+            self._state = "done"
+            callbacks = self._finish()
+        finally:
+            self._condition.release()
+        for callback in callbacks: callback(self)
+
+    def _finish(self):
+        self._condition.notifyAll()
+        callbacks, self._callbacks = self._callbacks, []
+        return callbacks
+
+    def _wait(self, timeout):
+        if timeout is None:
+            while self._state in ("pending", "running"):
+                self._condition.wait()
+            return
+        deadline = time.time() + timeout
+        while self._state in ("pending", "running"):
+            remaining = deadline - time.time()
+            if remaining <= 0: raise TimeoutError()
+            self._condition.wait(remaining)
+
+    def add_done_callback(self, callback):
+        """Calls the given callback, with the future as its argument, once
+           the future is done or cancelled."""
+        self._condition.acquire()
+        try:
+            if self._state in ("pending", "running"):
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._condition.release()
+        callback(self)
+
+    def cancel(self):
+        """Cancels the future if it has not started running, and answers if
+           the future is cancelled."""
+        self._condition.acquire()
+        try:
+            if self._state == "pending":
+                self._state = "cancelled"
+                callbacks = self._finish()
+            else:
+                return self._state == "cancelled"
+        finally:
+            self._condition.release()
+        for callback in callbacks: callback(self)
+        return True
+
+    def cancelled(self):
+        return self._state == "cancelled"
+
+    def done(self):
+        return self._state in ("cancelled", "done")
+
+    def exception(self, timeout=None):
+        """Waits for the future and returns the exception it raised, if any,
+           otherwise None."""
+        self._condition.acquire()
+        try:
+            self._wait(timeout)
+            if self._state == "cancelled": raise CancelledError()
+            return self._exc_info[1] if self._exc_info else None
+        finally:
+            self._condition.release()
+
+    def result(self, timeout=None):
+        """Waits for the future and returns its result, re-raising the
+           exception raised by the callable, if any."""
+        self._condition.acquire()
+        try:
+            self._wait(timeout)
+            if self._state == "cancelled": raise CancelledError()
+            if self._exc_info is not None:
+                raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+            return self._result
+        finally:
+            self._condition.release()
+
+    def running(self):
+        return self._state == "running"
+
+    def set_exception(self, exc_info=None):
+        self._complete(None, exc_info or sys.exc_info())
+
+    def set_result(self, value):
+        self._complete(value, None)
+
+    def set_running(self):
+        """Marks the future as running, answering False if it was cancelled
+           and should not be run."""
+        self._condition.acquire()
+        try:
+            if self._state != "pending": return False
+            self._state = "running"
+            return True
+        finally:
+            self._condition.release()
+
+class Executor(object):
+    """Runs submitted callables on a bounded pool of worker threads, which
+       are started on demand."""
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        if max_workers < 1: raise ValueError("max_workers must be >= 1")
+        self.max_workers = max_workers
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._idle = 0          # Workers waiting for work
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            self._lock.acquire()
+            self._idle -= 1
+            self._lock.release()
+            if item is None: return # Shutdown
+            future, fn, args, kwargs = item
+            if future.set_running():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except:
+                    future.set_exception()
+            del item, future # Don't hold on to the result while idle
+            self._lock.acquire()
+            self._idle += 1
+            self._lock.release()
+
+    def map(self, fn, *iterables):
+        """Like the map builtin, but calls fn concurrently, returning an
+           iterator over the results in order."""
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        def results():
+            try:
+                for future in futures: yield future.result()
+            finally:
+                for future in futures: future.cancel()
+        return results()
+
+    def shutdown(self, wait=True):
+        """Stops the workers once the queued work is done, optionally
+           waiting for them to exit."""
+        self._lock.acquire()
+        try:
+            if not self._shutdown:
+                self._shutdown = True
+                for thread in self._threads: self._queue.put(None)
+        finally:
+            self._lock.release()
+        if wait:
+            for thread in self._threads: thread.join()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules fn(*args, **kwargs) and returns its Future."""
+        future = Future()
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit after shutdown")
+            self._queue.put((future, fn, args, kwargs))
+            if self._idle < self._queue.qsize() and \
+               len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                self._idle += 1
+                self._threads.append(thread)
+                thread.start()
+                executors[self] = True
+        finally:
+            self._lock.release()
+        return future
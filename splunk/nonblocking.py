@@ -0,0 +1,926 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+#
+# This module provides a non-blocking counterpart to the binding layer. It
+# is built on a small, single threaded event loop over non-blocking sockets
+# and a pooled HTTP/1.1 client, so that a single process can have a large
+# number of REST calls in flight at once.
+#
+# Every call that talks to splunkd returns an Operation, which completes
+# when the call does. Operations may be chained with callbacks, but the
+# more convenient style is to write a coroutine: a generator that yields
+# operations (or lists of operations) and is resumed with their results,
+# for example:
+#
+#   def search(service, query):
+#       sid = yield service.create_job(query, exec_mode="blocking")
+#       response = yield service.job_results(sid, count=0)
+#       body = yield response.body.readall()
+#       raise Return(body)
+#
+#   loop = Loop()
+#   service = AsyncService(loop=loop, **kwargs)
+#   loop.run(service.login())
+#   operations = [loop.spawn(search(service, query)) for query in queries]
+#   results = loop.run(gather(operations))
+#
+
+"""Non-blocking interface to the Splunk REST API."""
+
+import errno
+import heapq
+import select
+import socket
+import ssl
+from StringIO import StringIO
+import sys
+import time
+import types
+from xml.etree.ElementTree import XML
+
+from splunk.binding import Context, HTTPError, IDEMPOTENT_METHODS
+from splunk.binding import PRELOAD_LIMIT, encode, spliturl
+import splunk.data as data
+from splunk.data import record
+
+__all__ = [
+    "AsyncContext",
+    "AsyncService",
+    "gather",
+    "Loop",
+    "Operation",
+    "Return",
+]
+
+DEFAULT_CONNECTIONS = 16 # Max open connections per (scheme, host, port)
+DEFAULT_IDLE = 10 # Seconds an idle connection may be kept for reuse
+
+BUFFER_LIMIT = 1048576 # Buffered body bytes before we stop reading
+READ_SIZE = 65536
+MAX_HEAD_SIZE = 65536
+
+PATH_JOBS = "search/jobs/"
+
+_WOULDBLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS)
+_SSL_WANT = (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE)
+
+# Raised from a coroutine to complete its operation with the given value.
+class Return(Exception):
+    def __init__(self, value=None):
+        Exception.__init__(self, value)
+        self.value = value
+
+class Operation(object):
+    """The eventual outcome of a non-blocking call."""
+    def __init__(self):
+        self._callbacks = []
+        self._exc_info = None
+        self._value = None
+        self.done = False
+
+    def add_callback(self, callback):
+        """Arranges for callback(operation) to be called on completion, or
+           calls it immediately if the operation is already complete."""
+        if self.done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _complete(self, value, exc_info):
+        if self.done: return
+        self._value = value
+        self._exc_info = exc_info
+        self.done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks: callback(self)
+
+    def exc_info(self):
+        """Returns the exc_info triple of a failed operation, or None."""
+        return self._exc_info
+
+    def result(self):
+        """Returns the result of the completed operation, or raises the
+           exception it completed with."""
+        if not self.done:
+            raise ValueError("Operation is not complete")
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+    def set_exception(self, exc_info=None):
+        """Completes the operation with the given (or current) exception."""
+        if exc_info is None: exc_info = sys.exc_info()
+        self._complete(None, exc_info)
+
+    def set_result(self, value):
+        """Completes the operation with the given value."""
+        self._complete(value, None)
+
+def gather(operations):
+    """Returns an operation that completes with the list of results of the
+       given operations once all of them have completed, or with the first
+       failure among them."""
+    result = Operation()
+    operations = list(operations)
+    pending = [len(operations)]
+    if pending[0] == 0:
+        result.set_result([])
+        return result
+    def done(_):
+        pending[0] -= 1
+        if pending[0] > 0: return
+        for operation in operations:
+            if operation.exc_info() is not None:
+                result.set_exception(operation.exc_info())
+                return
+        result.set_result([operation.result() for operation in operations])
+    for operation in operations: operation.add_callback(done)
+    return result
+
+# Drives a generator based coroutine, completing its operation when the
+# generator is exhausted or raises.
+class Task(object):
+    def __init__(self, loop, generator):
+        self.loop = loop
+        self.operation = Operation()
+        self._generator = generator
+        loop.call_soon(lambda: self._step(None, None))
+
+    def _resume(self, operation):
+        self.loop.call_soon(
+            lambda: self._step(operation._value, operation.exc_info()))
+
+    def _step(self, value, exc_info):
+        try:
+            if exc_info is None:
+                yielded = self._generator.send(value)
+            else:
+                yielded = self._generator.throw(*exc_info)
+        except StopIteration:
+            self.operation.set_result(None)
+            return
+        except Return, e:
+            self.operation.set_result(e.value)
+            return
+        except Exception:
+            self.operation.set_exception()
+            return
+        if isinstance(yielded, (list, tuple)):
+            yielded = gather(yielded)
+        if not isinstance(yielded, Operation):
+            try:
+                raise TypeError("Coroutine yielded %r" % yielded)
+            except TypeError:
+                self.loop.call_soon(
+                    lambda info=sys.exc_info(): self._step(None, info))
+            return
+        yielded.add_callback(self._resume)
+
+# Channels registered with the loop provide: fileno(), readable(), writable(),
+# pending() (answers if data is buffered above the socket, eg: by SSL),
+# busy() (answers if the channel has work outstanding), handle_read() and
+# handle_write().
+class Loop(object):
+    """A single threaded event loop over non-blocking sockets and timers."""
+    def __init__(self):
+        self._channels = {} # fileno => channel
+        self._ready = []    # Callbacks to run on the next iteration
+        self._timers = []   # Heap of [deadline, seq, callback]
+        self._seq = 0
+
+    def add_channel(self, channel):
+        self._channels[channel.fileno()] = channel
+
+    def remove_channel(self, channel):
+        self._channels.pop(channel.fileno(), None)
+
+    def call_later(self, secs, callback):
+        """Calls the given callback after the given number of secs and
+           returns a timer that may be passed to cancel."""
+        self._seq += 1
+        timer = [time.time() + secs, self._seq, callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def call_soon(self, callback):
+        """Calls the given callback on the next iteration of the loop."""
+        self._ready.append(callback)
+
+    def cancel(self, timer):
+        """Cancels the given timer."""
+        timer[2] = None
+
+    def run(self, operation=None):
+        """Runs the loop until the given operation completes, returning its
+           result, or, if no operation is given, until there is no work
+           left that the loop can do without the caller, such as a body
+           that is held back until the caller reads it."""
+        while True:
+            if operation is not None and operation.done:
+                return operation.result()
+            if not self._ready and not self._timers and not self._active():
+                # Nothing left to wait on, polling would just spin
+                if operation is None: return None
+                raise RuntimeError("Operation can't complete, nothing to run")
+            self.run_once()
+
+    def run_once(self, timeout=None):
+        """Runs a single iteration of the loop."""
+        while self._timers and self._timers[0][2] is None:
+            heapq.heappop(self._timers)
+
+        if self._ready:
+            timeout = 0
+        elif self._timers:
+            delay = max(0, self._timers[0][0] - time.time())
+            timeout = delay if timeout is None else min(timeout, delay)
+
+        self._poll(timeout)
+
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            callback = heapq.heappop(self._timers)[2]
+            if callback is not None: callback()
+
+        ready, self._ready = self._ready, []
+        for callback in ready: callback()
+
+    def sleep(self, secs):
+        """Returns an operation that completes after the given secs."""
+        operation = Operation()
+        self.call_later(secs, lambda: operation.set_result(None))
+        return operation
+
+    def spawn(self, generator):
+        """Starts running the given coroutine and returns its operation."""
+        if not isinstance(generator, types.GeneratorType):
+            raise TypeError("Expected a generator, got %r" % generator)
+        return Task(self, generator).operation
+
+    # Answers if any channel has an exchange that can make progress, as
+    # opposed to one that is waiting for its body to be read.
+    def _active(self):
+        for channel in self._channels.itervalues():
+            if channel.busy() and (channel.readable() or channel.writable()):
+                return True
+        return False
+
+    def _poll(self, timeout):
+        readers = []
+        writers = []
+        pending = []
+        for fileno, channel in self._channels.items():
+            if channel.readable():
+                readers.append(fileno)
+                if channel.pending(): pending.append(fileno)
+            if channel.writable():
+                writers.append(fileno)
+
+        if pending: timeout = 0
+
+        if not readers and not writers:
+            if timeout: time.sleep(timeout)
+            return
+
+        events = []
+        if hasattr(select, "poll"):
+            poller = select.poll()
+            flags = {}
+            for fileno in readers:
+                flags[fileno] = select.POLLIN | select.POLLPRI
+            for fileno in writers:
+                flags[fileno] = flags.get(fileno, 0) | select.POLLOUT
+            for fileno, mask in flags.iteritems():
+                poller.register(fileno, mask)
+            try:
+                result = poller.poll(None if timeout is None else timeout*1000)
+            except select.error, e:
+                if e.args[0] != errno.EINTR: raise
+                result = []
+            for fileno, mask in result:
+                readable = mask & (select.POLLIN | select.POLLPRI |
+                                   select.POLLHUP | select.POLLERR)
+                writable = mask & select.POLLOUT
+                events.append((fileno, readable, writable))
+        else:
+            try:
+                r, w, _ = select.select(readers, writers, [], timeout)
+            except select.error, e:
+                if e.args[0] != errno.EINTR: raise
+                r, w = [], []
+            for fileno in set(r) | set(w):
+                events.append((fileno, fileno in r, fileno in w))
+
+        signaled = set([fileno for fileno, _, _ in events])
+        for fileno in pending:
+            if fileno not in signaled: events.append((fileno, True, False))
+
+        for fileno, readable, writable in events:
+            channel = self._channels.get(fileno, None)
+            if channel is not None and writable: channel.handle_write()
+            channel = self._channels.get(fileno, None)
+            if channel is not None and readable: channel.handle_read()
+
+class BodyStream(object):
+    """A non-blocking reader of a streamed response body."""
+    def __init__(self):
+        self._chunks = []
+        self._exc_info = None
+        self._waiter = None
+        self.buffered = 0  # Bytes received but not yet read
+        self.done = False
+
+    def _feed(self, data):
+        self._chunks.append(data)
+        self.buffered += len(data)
+        self._wake()
+
+    def _fail(self, exc_info):
+        self._exc_info = exc_info
+        self.done = True
+        self._wake()
+
+    def _finish(self):
+        self.done = True
+        self._wake()
+
+    def _take(self):
+        result = "".join(self._chunks)
+        self._chunks = []
+        self.buffered = 0
+        return result
+
+    def _wake(self):
+        if self._waiter is None: return
+        waiter, self._waiter = self._waiter, None
+        if self._chunks:
+            waiter.set_result(self._take())
+        elif self._exc_info is not None:
+            waiter.set_exception(self._exc_info)
+        elif self.done:
+            waiter.set_result("")
+
+    def getvalue(self):
+        """Returns the body received so far, without consuming it."""
+        return "".join(self._chunks)
+
+    def read(self):
+        """Returns an operation that completes with the next chunk of the
+           body, or with an empty string at the end of the body."""
+        operation = Operation()
+        if self._waiter is not None:
+            raise ValueError("A read is already pending")
+        self._waiter = operation
+        if self._chunks or self.done: self._wake()
+        return operation
+
+    def readall(self):
+        """Returns an operation that completes with the rest of the body."""
+        result = Operation()
+        parts = []
+        def step(operation):
+            if operation.exc_info() is not None:
+                result.set_exception(operation.exc_info())
+                return
+            chunk = operation.result()
+            if not chunk:
+                result.set_result("".join(parts))
+                return
+            parts.append(chunk)
+            self.read().add_callback(step)
+        self.read().add_callback(step)
+        return result
+
+# A single HTTP request/response exchange.
+class Exchange(object):
+    def __init__(self, method, path, head, body):
+        self.method = method
+        self.data = "%s %s HTTP/1.1\r\n%s\r\n%s" % (method, path, "".join(
+            ["%s: %s\r\n" % (key, value) for key, value in head.iteritems()
+             if value is not None]), body)
+        self.operation = Operation()
+        self.preload = False
+        self.response = None
+        self.retries = 1 # Retries allowed on a stale pooled connection
+        self.timer = None
+
+# A non-blocking HTTP/1.1 connection that carries one exchange at a time.
+class Connection(object):
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key # (scheme, host, port)
+        self.exchange = None
+        self.reused = False
+        self.stamp = time.time()
+        self._inbuf = ""
+        self._outbuf = ""
+        self._state = "connect"
+        self._body = None # Body mode: ("length", n) | ("chunked",) | ("close",)
+        self._keepalive = True
+        self._received = False
+        self._sent = False # Some of the request has reached the socket
+        self._wants_read = False # SSL handshake is waiting on the server
+        self.counted = False # Counted against the client's maxsize
+
+        scheme, host, port = key
+        family, type_, proto, _, address = socket.getaddrinfo(
+            host, port, 0, socket.SOCK_STREAM)[0]
+        self.socket = socket.socket(family, type_, proto)
+        self.socket.setblocking(0)
+        result = self.socket.connect_ex(address)
+        if result not in (0,) + _WOULDBLOCK:
+            self.socket.close()
+            raise socket.error(result, errno.errorcode.get(result, ""))
+        client.loop.add_channel(self)
+
+    def busy(self):
+        return self.exchange is not None
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def pending(self):
+        return isinstance(self.socket, ssl.SSLSocket) and \
+            self._state not in ("connect", "handshake") and \
+            self.socket.pending() > 0
+
+    def readable(self):
+        if self._state in ("connect", "closed"): return False
+        exchange = self.exchange
+        if exchange is not None and exchange.response is not None and \
+           not exchange.preload:
+            # Apply backpressure when the consumer isn't keeping up
+            if exchange.response.body.buffered >= BUFFER_LIMIT: return False
+        return True
+
+    def writable(self):
+        if self._state == "connect": return True
+        if self._state == "handshake": return not self._wants_read
+        return len(self._outbuf) > 0
+
+    def start(self, exchange):
+        """Begins the given exchange on this connection."""
+        self.exchange = exchange
+        self._inbuf = ""
+        self._outbuf = exchange.data
+        self._received = False
+        self._sent = False
+        self._body = None
+        if self._state == "idle": self._state = "head"
+
+    def close(self):
+        if self._state == "closed": return
+        self._state = "closed"
+        self.client.loop.remove_channel(self)
+        try:
+            self.socket.close()
+        except socket.error:
+            pass
+
+    # Fail the current exchange with the given exc_info and drop the
+    # connection, retrying the exchange if the connection was reused and
+    # the server dropped it before responding. A request that may have
+    # reached the server is only retried if its method is idempotent.
+    def fail(self, exc_info):
+        exchange, self.exchange = self.exchange, None
+        self.close()
+        self.client._discard(self)
+        if exchange is None: return
+        if self.reused and not self._received and exchange.retries > 0 and \
+           (not self._sent or exchange.method in IDEMPOTENT_METHODS):
+            exchange.retries -= 1
+            self.client._submit(self.key, exchange)
+            return
+        self.client._finish(exchange)
+        if exchange.response is None:
+            exchange.operation.set_exception(exc_info)
+        else:
+            exchange.response.body._fail(exc_info)
+
+    def handle_read(self):
+        if self._state == "handshake":
+            return self._handshake()
+        try:
+            for _ in range(16): # Bound the work done per event
+                try:
+                    data = self.socket.recv(READ_SIZE)
+                except ssl.SSLError, e:
+                    if e.args[0] in _SSL_WANT: return
+                    raise
+                except socket.error, e:
+                    if e.args[0] in _WOULDBLOCK: return
+                    raise
+                if not data:
+                    return self._eof()
+                self._received = True
+                if self._state == "idle":
+                    raise socket.error("Unexpected data on idle connection")
+                self._inbuf += data
+                self._process()
+                if self._state in ("idle", "closed") or not self.readable():
+                    return
+        except Exception:
+            self.fail(sys.exc_info())
+
+    def handle_write(self):
+        try:
+            if self._state == "connect":
+                error = self.socket.getsockopt(
+                    socket.SOL_SOCKET, socket.SO_ERROR)
+                if error != 0:
+                    raise socket.error(error, errno.errorcode.get(error, ""))
+                if self.key[0] == "https":
+                    self.client.loop.remove_channel(self)
+                    self.socket = ssl.wrap_socket(self.socket,
+                        keyfile=self.client.key_file,
+                        certfile=self.client.cert_file,
+                        do_handshake_on_connect=False)
+                    self.client.loop.add_channel(self)
+                    self._state = "handshake"
+                    return self._handshake()
+                self._state = "head"
+                return
+            if self._state == "handshake":
+                return self._handshake()
+            if self._outbuf:
+                try:
+                    count = self.socket.send(self._outbuf)
+                except ssl.SSLError, e:
+                    if e.args[0] in _SSL_WANT: return
+                    raise
+                except socket.error, e:
+                    if e.args[0] in _WOULDBLOCK: return
+                    raise
+                if count > 0: self._sent = True
+                self._outbuf = self._outbuf[count:]
+        except Exception:
+            self.fail(sys.exc_info())
+
+    def _handshake(self):
+        try:
+            self.socket.do_handshake()
+        except ssl.SSLError, e:
+            if e.args[0] in _SSL_WANT:
+                self._wants_read = e.args[0] == ssl.SSL_ERROR_WANT_READ
+                return
+            self.fail(sys.exc_info())
+            return
+        except Exception:
+            self.fail(sys.exc_info())
+            return
+        self._state = "head"
+
+    def _eof(self):
+        if self._state == "body" and self._body[0] == "close":
+            self._keepalive = False
+            return self._complete()
+        if self.exchange is None:
+            # The server closed an idle connection
+            self.close()
+            self.client._discard(self)
+            return
+        raise socket.error("Connection closed by server")
+
+    # Parse as much of the response as is available in the input buffer.
+    def _process(self):
+        while self._state in ("head", "body", "chunk", "crlf", "trailer"):
+            if self._state == "head":
+                index = self._inbuf.find("\r\n\r\n")
+                if index == -1:
+                    if len(self._inbuf) > MAX_HEAD_SIZE:
+                        raise ValueError("Response header too large")
+                    return
+                head = self._inbuf[:index]
+                self._inbuf = self._inbuf[index+4:]
+                self._head(head)
+            elif self._state == "body":
+                mode = self._body[0]
+                if mode == "close":
+                    self._feed(self._inbuf)
+                    self._inbuf = ""
+                    return
+                remaining = self._body[1]
+                chunk = self._inbuf[:remaining]
+                self._inbuf = self._inbuf[remaining:]
+                remaining -= len(chunk)
+                self._feed(chunk)
+                if remaining > 0:
+                    self._body = (mode, remaining)
+                    return
+                if mode == "length":
+                    return self._complete()
+                self._state = "crlf"
+            elif self._state == "crlf":
+                if len(self._inbuf) < 2: return
+                self._inbuf = self._inbuf[2:]
+                self._state = "chunk"
+            elif self._state == "chunk":
+                index = self._inbuf.find("\r\n")
+                if index == -1: return
+                size = int(self._inbuf[:index].split(';', 1)[0], 16)
+                self._inbuf = self._inbuf[index+2:]
+                if size == 0:
+                    self._state = "trailer"
+                else:
+                    self._state = "body"
+                    self._body = ("chunked", size)
+            elif self._state == "trailer":
+                index = self._inbuf.find("\r\n")
+                if index == -1: return
+                line = self._inbuf[:index]
+                self._inbuf = self._inbuf[index+2:]
+                if line == "": return self._complete()
+
+    def _feed(self, data):
+        if data: self.exchange.response.body._feed(data)
+
+    def _head(self, head):
+        lines = head.split("\r\n")
+        parts = lines[0].split(None, 2)
+        version = parts[0]
+        status = int(parts[1])
+        reason = parts[2] if len(parts) > 2 else ""
+        if 100 <= status < 200:
+            return # Informational, keep looking for the real response
+        headers = []
+        for line in lines[1:]:
+            key, _, value = line.partition(':')
+            headers.append((key.strip().lower(), value.strip()))
+        hdict = dict(headers)
+
+        connection = hdict.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            self._keepalive = connection == "keep-alive"
+        else:
+            self._keepalive = connection != "close"
+
+        length = None
+        if self.exchange.method == "HEAD" or status in (204, 304):
+            self._body = ("length", 0)
+            length = 0
+        elif "chunked" in hdict.get("transfer-encoding", "").lower():
+            self._body = ("chunked",)
+        elif "content-length" in hdict:
+            length = int(hdict["content-length"])
+            self._body = ("length", length)
+        else:
+            self._body = ("close",)
+            self._keepalive = False
+
+        response = record({
+            'status': status,
+            'reason': reason,
+            'headers': headers,
+            'body': BodyStream(),
+        })
+        self.exchange.response = response
+        self._state = "chunk" if self._body[0] == "chunked" else "body"
+
+        # Errors and small bodies are delivered complete, everything else
+        # is delivered as soon as the head arrives and streams thereafter.
+        self.exchange.preload = status >= 400 or \
+            (length is not None and length <= PRELOAD_LIMIT)
+        if not self.exchange.preload:
+            self.exchange.operation.set_result(response)
+        if length == 0:
+            self._complete()
+
+    def _complete(self):
+        exchange, self.exchange = self.exchange, None
+        response = exchange.response
+        if self._keepalive and not self._inbuf:
+            self._state = "idle"
+            self.stamp = time.time()
+            self.client._release(self)
+        else:
+            self.close()
+            self.client._discard(self)
+        self.client._finish(exchange)
+        response.body._finish()
+        if not exchange.preload: return
+        if response.status >= 400:
+            failed = record(response)
+            failed.body = StringIO(response.body.getvalue())
+            try:
+                raise HTTPError(failed)
+            except HTTPError:
+                exchange.operation.set_exception()
+        else:
+            exchange.operation.set_result(response)
+
+class Client(object):
+    """A non-blocking HTTP/1.1 client with a per-endpoint connection pool."""
+    def __init__(self, loop, key_file=None, cert_file=None, timeout=None,
+                 maxsize=DEFAULT_CONNECTIONS, idle_timeout=DEFAULT_IDLE):
+        self.loop = loop
+        self.key_file = key_file
+        self.cert_file = cert_file
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._active = {} # key => count of open connections
+        self._idle = {}   # key => [connection*]
+        self._queued = {} # key => [exchange*]
+
+    def close(self):
+        """Closes all idle connections."""
+        for connections in self._idle.values():
+            for connection in list(connections):
+                connection.close()
+                self._discard(connection)
+
+    def request(self, url, message):
+        """Issues the given request message and returns an operation that
+           completes with the corresponding response message."""
+        scheme, host, port, path = spliturl(url)
+        body = message.get("body", "")
+        head = {
+            "Content-Length": str(len(body)),
+            "Host": host,
+            "User-Agent": "splunk-sdk-python/0.1",
+            "Accept": "*/*",
+        } # defaults
+        for key, value in message.get("headers", []):
+            head[key] = value
+        exchange = Exchange(message.get("method", "GET"), path, head, body)
+        if self.timeout is not None:
+            exchange.timer = self.loop.call_later(
+                self.timeout, lambda: self._timeout(exchange))
+        self._submit((scheme, host, port), exchange)
+        return exchange.operation
+
+    def _discard(self, connection):
+        key = connection.key
+        idle = self._idle.get(key, [])
+        if connection in idle:
+            idle.remove(connection)
+        if connection.counted:
+            connection.counted = False
+            self._active[key] -= 1
+        queued = self._queued.get(key, [])
+        if queued and self._active.get(key, 0) < self.maxsize:
+            self._submit(key, queued.pop(0))
+
+    def _finish(self, exchange):
+        if exchange.timer is not None:
+            self.loop.cancel(exchange.timer)
+            exchange.timer = None
+
+    def _release(self, connection):
+        queued = self._queued.get(connection.key, [])
+        if queued:
+            connection.reused = True
+            connection.start(queued.pop(0))
+        else:
+            self._idle.setdefault(connection.key, []).append(connection)
+
+    def _submit(self, key, exchange):
+        idle = self._idle.get(key, [])
+        now = time.time()
+        while idle:
+            connection = idle.pop()
+            if now - connection.stamp < self.idle_timeout:
+                connection.reused = True
+                connection.start(exchange)
+                return
+            connection.close()
+            self._discard(connection)
+        if self._active.get(key, 0) >= self.maxsize:
+            self._queued.setdefault(key, []).append(exchange)
+            return
+        try:
+            connection = Connection(self, key)
+        except Exception:
+            self._finish(exchange)
+            exchange.operation.set_exception()
+            return
+        connection.counted = True
+        self._active[key] = self._active.get(key, 0) + 1
+        connection.start(exchange)
+
+    def _timeout(self, exchange):
+        exchange.timer = None
+        try:
+            raise socket.timeout("Request timed out")
+        except socket.timeout:
+            exc_info = sys.exc_info()
+        for queued in self._queued.itervalues():
+            if exchange in queued:
+                queued.remove(exchange)
+                exchange.operation.set_exception(exc_info)
+                return
+        for channel in self.loop._channels.values():
+            if getattr(channel, "exchange", None) is exchange:
+                exchange.retries = 0
+                channel.fail(exc_info)
+                return
+
+class AsyncContext(Context):
+    """A non-blocking binding context, whose requests return operations."""
+    # kwargs: scheme, host, port, username, password, namespace
+    def __init__(self, loop=None, key_file=None, cert_file=None,
+                 timeout=None, maxsize=DEFAULT_CONNECTIONS, **kwargs):
+        Context.__init__(self, **kwargs)
+        self.loop = Loop() if loop is None else loop
+        self.client = Client(self.loop, key_file, cert_file, timeout, maxsize)
+
+    def close(self):
+        """Closes the context's idle connections."""
+        self.client.close()
+
+    def delete(self, path, **kwargs):
+        """Issue a DELETE request to the given path."""
+        url = self.url(path)
+        if kwargs: url = url + '?' + encode(**kwargs)
+        return self.client.request(
+            url, { 'method': "DELETE", 'headers': self._headers() })
+
+    def get(self, path, **kwargs):
+        """Issue a GET request to the given path."""
+        url = self.url(path)
+        if kwargs: url = url + '?' + encode(**kwargs)
+        return self.client.request(
+            url, { 'method': "GET", 'headers': self._headers() })
+
+    def post(self, path, **kwargs):
+        """Issue a POST request to the given path."""
+        headers = self._headers()
+        headers.append(("Content-Type", "application/x-www-form-urlencoded"))
+        return self.client.request(self.url(path), {
+            'method': "POST",
+            'headers': headers,
+            'body': encode(**kwargs)
+        })
+
+    def request(self, path, message):
+        """Issue the given HTTP request message to the given endpoint."""
+        return self.client.request(
+            self.url(path), {
+                'method': message.get("method", "GET"),
+                'headers': message.get("headers", []) + self._headers(),
+                'body': message.get("body", "")})
+
+    def login(self):
+        """Issue a Splunk login request using the context's credentials and
+           store the session token for use on subsequent requests. Returns
+           an operation that completes with the context."""
+        return self.loop.spawn(self._login())
+
+    def _login(self):
+        response = yield self.client.request(
+            self.url("/services/auth/login"), {
+                'method': "POST",
+                'headers': [
+                    ("Content-Type", "application/x-www-form-urlencoded")],
+                'body': encode(username=self.username, password=self.password)
+            })
+        body = yield response.body.readall()
+        session = XML(body).findtext("./sessionKey")
+        self.token = "Splunk %s" % session
+        raise Return(self)
+
+class AsyncService(AsyncContext):
+    """A non-blocking Splunk service, with helpers for the search job
+       endpoints, which are the ones most worth driving concurrently."""
+    def _load(self, operation, match=None):
+        response = yield operation
+        body = yield response.body.readall()
+        raise Return(data.load(body, match))
+
+    def cancel_job(self, sid):
+        """Cancels the given job."""
+        return self.post(PATH_JOBS + sid + "/control", action="cancel")
+
+    def create_job(self, query, **kwargs):
+        """Creates a search job and returns an operation that completes
+           with its sid."""
+        def create():
+            value = yield self.loop.spawn(
+                self._load(self.post(PATH_JOBS, search=query, **kwargs)))
+            raise Return(value.response.sid)
+        return self.loop.spawn(create())
+
+    def job_results(self, sid, **kwargs):
+        """Returns an operation that completes with the job's results
+           response, whose body streams."""
+        return self.get(PATH_JOBS + sid + "/results", **kwargs)
+
+    def read_job(self, sid):
+        """Returns an operation that completes with the job's properties."""
+        def read():
+            value = yield self.loop.spawn(
+                self._load(self.get(PATH_JOBS + sid)))
+            raise Return(value.entry.content)
+        return self.loop.spawn(read())
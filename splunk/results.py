@@ -14,13 +14,39 @@
 
 """A progressive XML reader."""
 
+from array import array
+from collections import deque
+import csv
 from cStringIO import StringIO
+import json
+import re
 import xml.dom.pulldom as pulldom
+from xml.parsers import expat
 
 __all__ = [
+    "Batch",
+    "CSVResultsReader",
+    "ExpatResultsReader",
+    "JSONResultsReader",
+    "read_batches",
     "ResultsReader"
 ]
 
+READ_SIZE = 65536 # Chunk size used when reading from the stream
+
+BATCH_SIZE = 10000 # Rows per batch returned by read_batches
+
+# The export endpoint starts each results section with its own XML
+# declaration, which is only legal at the start of a document. These are
+# removed where a section starts, at the start of the stream or after the
+# close of the previous section, leaving any in the results themselves.
+XML_DECL = re.compile(r"(</results>\s*)<\?xml\s[^>]*\?>")
+XML_DECL_START = re.compile(r"^(\s*)<\?xml\s[^>]*\?>")
+SECTION_END = re.compile(r"</results>\s*$")
+
+# The separator between a key and its value in a JSON object.
+JSON_COLON = re.compile(r"\s*:\s*")
+
 # Splices a list of strings and file-like objects into a single stream
 class ListStream:
     def __init__(self, *args):
@@ -60,6 +86,8 @@ class ListStream:
 class XMLStream:
     def __init__(self, file_):
         self.file = XMLStream.prepare(file_)
+        self.tail = "" # Possibly partial declaration held back from a read
+        self.boundary = True # Does the data read so far end a section?
 
     # Prepare the stream by scanning the head of the stream until we find 
     # the first XML element so that we know where to inject the artificial 
@@ -94,11 +122,23 @@ class XMLStream:
             return ListStream(
                 head[:index], "<doc>", head[index:], file_, "</doc>\n")
 
+    # Reads the next chunk of the stream with the XML declarations that
+    # start sections removed.
     def read(self, size):
-        if self.file is not None:
-            return self.file.read(size)
-        else:
-            raise StopIteration
+        if self.file is None: raise StopIteration
+        while True:
+            chunk = self.file.read(size)
+            data = self.tail + chunk
+            self.tail = ""
+            if chunk:
+                index = data.rfind("<")
+                if index != -1 and data.find(">", index) == -1:
+                    data, self.tail = data[:index], data[index:]
+            if self.boundary: data = XML_DECL_START.sub(r"\1", data)
+            data = XML_DECL.sub(r"\1", data)
+            if data.strip():
+                self.boundary = SECTION_END.search(data) is not None
+            if data or not chunk: return data
             
 # A simplified XML 'reader' interface, that also abstracts the pulldom
 TAG = "TAG"         # kind, name, attrs
@@ -365,6 +405,11 @@ class ResultsReader:
             raise StopIteration()
         return self.item
 
+    def read_batches(self, size=BATCH_SIZE, schema=None, default=None):
+        """Returns an iterator over the remaining results in Batches of up
+           to size rows, see read_batches."""
+        return read_batches(self, size, schema, default)
+
     # Read the next search result, handling new sections and section metadata 
     # as necessarry. NOTE: if the pulldom reader raises StopIteration, we 
     # simply pass that through to indicate the end of our iterable.
@@ -399,3 +444,511 @@ class ResultsReader:
 
             self._error()
 
+# Escape the given text the way minidom does when serializing, so that <v>
+# values read by the expat reader are identical to those of the pulldom
+# based reader.
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;") \
+               .replace("\"", "&quot;").replace(">", "&gt;")
+
+# The base of readers that parse the stream in chunks, queueing up the
+# resulting (kind, value, fields) items, which are then handed out one at a
+# time using the same protocol as ResultsReader. Subclasses implement _fill,
+# which must either queue more items or set _done.
+class _ItemReader(object):
+    def __init__(self):
+        self._items = deque()
+        self._done = False
+        self.kind = None
+        self.value = None
+        self.fields = None
+
+    def __iter__(self):
+        return self
+
+    @property
+    def item(self):
+        return (self.kind, self.value)
+
+    def next(self):
+        kind = self.read()
+        if kind is None or self.value is None:
+            raise StopIteration()
+        return self.item
+
+    def read(self):
+        """Reads the next item, returning its kind, or None at the end of
+           the stream."""
+        while len(self._items) == 0:
+            if self._done:
+                self.kind = None
+                self.value = None
+                return None
+            self._fill()
+        self.kind, self.value, self.fields = self._items.popleft()
+        return self.kind
+
+    def read_batches(self, size=BATCH_SIZE, schema=None, default=None):
+        """Returns an iterator over the remaining results in Batches of up
+           to size rows, see read_batches."""
+        return read_batches(self, size, schema, default)
+
+class ExpatResultsReader(_ItemReader):
+    """A forward-only, streaming search results reader built on the expat
+       push parser. It yields the same items as ResultsReader, but parses
+       the stream in large chunks without building any DOM nodes."""
+    def __init__(self, stream):
+        _ItemReader.__init__(self)
+        self._stream = XMLStream(stream)
+        self._fed = False       # Any data fed to the parser yet?
+        self._fields = None     # Field order of the current results section
+        self._pending = False   # RESULTS item not yet emitted
+        self._attrs = None      # Attributes of the current results section
+        self._result = None     # Result being read
+        self._key = None        # Key of the field being read
+        self._values = None     # Values of the field being read
+        self._text = None       # Character data being collected, or None
+        self._msgtype = None    # Type of the message being read
+        self._raw = None        # Serialized <v> element being read
+        self._rawdepth = 0      # Element depth within <v>
+        self._rawopen = False   # Last start tag in <v> not yet closed
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.buffer_size = READ_SIZE
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._chars
+        self._parser = parser
+
+    def _chars(self, data):
+        if self._raw is not None:
+            if self._rawopen:
+                self._raw.append(">")
+                self._rawopen = False
+            self._raw.append(_escape(data))
+        elif self._text is not None:
+            self._text.append(data)
+
+    def _emit_results(self):
+        self._pending = False
+        self._items.append((RESULTS, self._attrs, self._fields))
+
+    def _fill(self):
+        try:
+            chunk = self._stream.read(READ_SIZE)
+        except StopIteration: # Empty stream
+            chunk = ""
+        if chunk:
+            self._fed = True
+            self._parser.Parse(chunk, False)
+        else:
+            if self._fed: self._parser.Parse("", True)
+            self._done = True
+
+    def _end(self, name):
+        if self._raw is not None:
+            if self._rawopen:
+                self._raw.append("/>")
+                self._rawopen = False
+            else:
+                self._raw.append("</%s>" % name)
+            self._rawdepth -= 1
+            if self._rawdepth == 0:
+                self._values = "".join(self._raw).encode("utf8")
+                self._raw = None
+            return
+
+        if name == "text":
+            text = "".join(self._text)
+            self._text = None
+            # Whitespace only text is dropped, as by the pulldom reader
+            if len(text.strip()) == 0: text = ""
+            self._values.append(text.encode("utf8"))
+        elif name == "field":
+            if self._result is not None:
+                values = self._values
+                if isinstance(values, list) and len(values) == 1:
+                    values = values[0]
+                self._result[self._key] = values
+                self._values = None
+            elif self._text is not None:
+                text = "".join(self._text)
+                self._text = None
+                self._fields.append(text if text.strip() else None)
+        elif name == "result":
+            self._items.append((RESULT, self._result, self._fields))
+            self._result = None
+        elif name == "msg":
+            text = "".join(self._text)
+            self._text = None
+            self._items.append((MESSAGE, {
+                'type': self._msgtype,
+                'message': text if text.strip() else None 
+            }, self._fields))
+        elif name == "meta" or name == "results":
+            if self._pending: self._emit_results()
+
+    def _start(self, name, attrs):
+        if self._raw is not None:
+            if self._rawopen: self._raw.append(">")
+            self._raw.append(self._tag(name, attrs))
+            self._rawopen = True
+            self._rawdepth += 1
+            return
+
+        if name == "result":
+            if self._pending: self._emit_results()
+            self._result = { '$offset': attrs['offset'].encode("utf8") }
+        elif name == "field":
+            if self._result is not None:
+                self._key = attrs["k"].encode("utf8")
+                self._values = []
+            else:
+                self._text = []
+        elif name == "text":
+            self._text = []
+        elif name == "v":
+            self._raw = [self._tag(name, attrs)]
+            self._rawopen = True
+            self._rawdepth = 1
+        elif name == "msg":
+            if self._pending: self._emit_results()
+            self._msgtype = attrs["type"]
+            self._text = []
+        elif name == "results":
+            self._fields = []
+            self._attrs = attrs if len(attrs) > 0 else None
+            self._pending = True
+
+    @staticmethod
+    def _tag(name, attrs):
+        items = sorted(attrs.items())
+        return "<%s%s" % (name, "".join(
+            [' %s="%s"' % (key, _escape(value)) for key, value in items]))
+
+# Convert a decoded JSON field value into the form used by ResultsReader:
+# a UTF-8 string for single values and a list of them for multiple values.
+def _json_value(value):
+    if isinstance(value, list):
+        if len(value) == 1: return _json_value(value[0])
+        return [_json_value(item) for item in value]
+    if isinstance(value, unicode): return value.encode("utf8")
+    if value is None: return ""
+    return str(value)
+
+class JSONResultsReader(_ItemReader):
+    """A forward-only, streaming search results reader for output_mode=json.
+       It yields the same kinds of items as ResultsReader, and decodes the
+       stream one row at a time, including the rows of a results array
+       before the rest of its section has arrived. Both results arrays and
+       the row-per-line export format are understood."""
+    def __init__(self, stream):
+        _ItemReader.__init__(self)
+        self._stream = stream
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._wanted = 0        # Buffer size needed before decoding again
+        self._inarray = False   # Inside a top level array of rows?
+        self._object_value = None   # Keys so far of the object being read
+        self._inrows = False    # Inside the object's results array?
+        self._streamed = False  # Were the object's results streamed?
+        self._fields = None     # Field names of the current section
+        self._preview = None    # Preview flag of the current section
+        self._offset = 0        # Offset of the next row in the section
+
+    # Queue a RESULTS item for a new section with the given preview flag
+    # and field names.
+    def _section(self, preview, fields):
+        self._preview = preview
+        self._fields = fields
+        self._offset = 0
+        attrs = {}
+        if preview is not None:
+            attrs[u'preview'] = u'1' if preview else u'0'
+        self._items.append((RESULTS, attrs, fields))
+
+    def _messages(self, messages):
+        for message in messages:
+            self._items.append((MESSAGE, {
+                'type': message.get('type'),
+                'message': message.get('text', message.get('message'))
+            }, self._fields))
+
+    def _row(self, row, offset=None, preview=None):
+        if self._fields is None or \
+           (preview is not None and preview != self._preview):
+            self._section(preview, sorted(row.keys()))
+        result = {}
+        for key, value in row.iteritems():
+            result[key.encode("utf8")] = _json_value(value)
+        if offset is None: offset = self._offset
+        result['$offset'] = str(offset)
+        self._offset = int(offset) + 1
+        self._items.append((RESULT, result, self._fields))
+
+    def _object(self, value):
+        if not isinstance(value, dict):
+            raise ValueError("Unexpected JSON value: %r" % value)
+        if 'result' in value: # Export, one row per object
+            self._messages(value.get('messages', []))
+            self._row(value['result'],
+                value.get('offset', None), value.get('preview', False))
+        elif 'results' in value: # A complete results section
+            self._start(value)
+            for row in value['results']: self._row(row, preview=self._preview)
+        elif 'messages' in value and len(value) <= 3: # Messages only
+            self._messages(value['messages'])
+        else:
+            self._row(value)
+
+    # Start a results section described by the given object, whose rows
+    # follow. Its messages are queued and removed from the object.
+    def _start(self, value):
+        fields = value.get('fields', None)
+        if fields is not None:
+            fields = [field['name'] if isinstance(field, dict) else field
+                      for field in fields]
+        self._section(value.get('preview', None), fields)
+        self._messages(value.pop('messages', []))
+        self._offset = value.get('init_offset', 0)
+
+    # Decode the JSON value at the given buffer position, returning the
+    # value and its end, or None if the buffer may not hold all of it yet.
+    def _scan(self, buffer, pos):
+        try:
+            value, end = self._decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if self._eof: raise
+            return None
+        # A number that ends the buffer may go on in the next read
+        if end == len(buffer) and not self._eof and buffer[end-1].isdigit():
+            return None
+        return value, end
+
+    # Decode as many values as the buffer holds. Objects are decoded a key
+    # at a time, so that the rows of a results array are read one by one
+    # rather than after the whole section has arrived.
+    def _decode(self):
+        buffer = self._buffer
+        pos = self._pos
+        size = len(buffer)
+        while True:
+            while pos < size and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == size: break
+            char = buffer[pos]
+            if self._object_value is None: # Outside of any object
+                if char == '{':
+                    self._object_value = {}
+                    pos += 1
+                    continue
+                if not self._inarray and char == '[':
+                    self._inarray = True
+                    pos += 1
+                    continue
+                if self._inarray and char == ']':
+                    self._inarray = False
+                    pos += 1
+                    continue
+                decoded = self._scan(buffer, pos)
+                if decoded is None: break
+                value, pos = decoded
+                for item in value: self._object(item)
+            elif self._inrows: # Inside a results array
+                if char == ']':
+                    self._inrows = False
+                    pos += 1
+                    continue
+                decoded = self._scan(buffer, pos)
+                if decoded is None: break
+                row, pos = decoded
+                self._row(row, preview=self._preview)
+            elif char == '}':
+                value, self._object_value = self._object_value, None
+                if self._streamed:
+                    self._streamed = False
+                    self._messages(value.get('messages', []))
+                else:
+                    self._object(value)
+                pos += 1
+            else:
+                decoded = self._scan(buffer, pos)
+                if decoded is None: break
+                key, end = decoded
+                match = JSON_COLON.match(buffer, end)
+                if match is None or match.end() == size:
+                    if self._eof: raise ValueError("Expected ':' after key")
+                    break
+                end = match.end()
+                if key == u'results' and buffer[end] == '[':
+                    self._start(self._object_value)
+                    self._inrows = True
+                    self._streamed = True
+                    pos = end + 1
+                    continue
+                decoded = self._scan(buffer, end)
+                if decoded is None: break
+                self._object_value[key], pos = decoded
+        if pos < size:
+            # Incomplete value, wait until the buffer has doubled before
+            # trying again so that large values don't decode in O(n^2)
+            self._wanted = 2 * (size - pos)
+        self._buffer = buffer[pos:]
+        self._pos = 0
+
+    def _fill(self):
+        chunk = self._stream.read(READ_SIZE)
+        if chunk:
+            self._buffer += chunk
+            if len(self._buffer) - self._pos >= self._wanted:
+                self._wanted = 0
+                self._decode()
+        else:
+            self._eof = True
+            self._decode()
+            self._done = True
+
+# Split a Splunk multi-value CSV encoding, eg: $a$;$b$ into its values.
+def _mv_values(text):
+    if len(text) > 1 and text[0] == "$" and text[-1] == "$":
+        text = text[1:-1]
+    return [part.replace("$$", "$") for part in text.split("$;$")]
+
+class CSVResultsReader(_ItemReader):
+    """A forward-only, streaming search results reader for output_mode=csv.
+       It yields the same kinds of items as ResultsReader, and decodes the
+       stream one row at a time. Each section starts with a header row,
+       at the start of the stream or after a blank line, and a section
+       whose header matches the previous one continues its results.
+       Multi-valued fields are recovered from the __mv_ columns when
+       present."""
+    def __init__(self, stream):
+        _ItemReader.__init__(self)
+        self._stream = stream
+        self._pending = ""
+        self._reader = csv.reader(self._lines())
+        self._header = None
+        self._boundary = True   # The next row is a section header
+        self._mv = None     # [(index, name)*] of __mv_ columns
+        self._offset = 0
+
+    # Yield the lines of the stream, with their line terminators, reading
+    # the stream in large chunks.
+    def _lines(self):
+        while True:
+            chunk = self._stream.read(READ_SIZE)
+            if not chunk: break
+            lines = (self._pending + chunk).split("\n")
+            self._pending = lines.pop()
+            for line in lines: yield line + "\n"
+        if self._pending: yield self._pending
+
+    def _fill(self):
+        count = 0
+        for row in self._reader:
+            if len(row) == 0:
+                # A blank line ends a section, the next row is its header
+                self._boundary = True
+                continue
+            if self._boundary:
+                self._boundary = False
+                if row != self._header: self._start(row)
+                continue
+            self._row(row)
+            count += 1
+            if count == 1000: return
+        self._done = True
+
+    def _row(self, row):
+        result = {}
+        for key, value in zip(self._header, row):
+            result[key] = value
+        for index, name in self._mv:
+            if index < len(row):
+                del result[self._header[index]]
+                if row[index]: result[name] = _mv_values(row[index])
+        result['$offset'] = str(self._offset)
+        self._offset += 1
+        self._items.append((RESULT, result, self._fields))
+
+    def _start(self, header):
+        self._header = header
+        self._mv = [(index, name[5:]) for index, name in enumerate(header)
+                    if name.startswith("__mv_")]
+        self._fields = [name for name in header if not name.startswith("__mv_")]
+        self._items.append((RESULTS, {}, self._fields))
+
+class Batch(dict):
+    """A batch of result rows, held in columns. The batch maps each field
+       name to its column, which has a value for each of the batch's rows.
+       Numeric columns are array.arrays, which support the buffer interface
+       (eg: numpy.frombuffer), and other columns are lists of interned
+       strings, or lists of them for multi-valued fields."""
+    def __init__(self):
+        dict.__init__(self)
+        self.rows = 0
+
+NAN = float("nan")
+
+# Appends the given field value to the given column, converting it to the
+# column's type. Empty and missing values are None in string columns, 0 in
+# integer columns and NaN in float columns, and multi-valued fields only
+# contribute their first value to numeric columns.
+def _append(column, value):
+    if isinstance(column, list):
+        if isinstance(value, str):
+            value = intern(value)
+        elif isinstance(value, list):
+            value = [intern(item) for item in value]
+        column.append(value)
+        return
+    if isinstance(value, list):
+        value = value[0] if len(value) > 0 else None
+    if column.typecode in "fd":
+        column.append(float(value) if value else NAN)
+    elif value:
+        try:
+            column.append(int(value))
+        except ValueError:
+            column.append(int(float(value)))
+    else:
+        column.append(0)
+
+def read_batches(reader, size=BATCH_SIZE, schema=None, default=None):
+    """Returns an iterator over the results read by the given reader in
+       column oriented Batches of up to size rows. The schema maps field
+       names to the array typecode of their column, or None for a string
+       column, and fields that it doesn't name get the default typecode.
+       Internal fields, such as $offset, are left out. A value that a
+       numeric column can't hold raises a ValueError naming its field."""
+    if schema is None: schema = {}
+    batch = Batch()
+    for kind, value in reader:
+        if kind != RESULT: continue
+        count = 0 # Columns appended to
+        for key, item in value.iteritems():
+            if key.startswith("$"): continue
+            count += 1
+            column = batch.get(key, None)
+            if column is None:
+                # A field that is new to the batch, earlier rows lack it
+                typecode = schema.get(key, default)
+                column = [] if typecode is None else array(typecode)
+                for i in xrange(batch.rows): _append(column, None)
+                batch[key] = column
+            try:
+                _append(column, item)
+            except (ValueError, OverflowError):
+                raise ValueError(
+                    "Field %s has a non-numeric value: %r" % (key, item))
+        batch.rows += 1
+        if count < len(batch): # Fields that the row lacks
+            for column in batch.itervalues():
+                if len(column) < batch.rows: _append(column, None)
+        if batch.rows == size:
+            yield batch
+            batch = Batch()
+    if batch.rows > 0: yield batch
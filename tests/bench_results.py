@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measures the throughput, in rows per second, of the search results 
+   readers over a synthetic XML results stream that mimics an export."""
+
+from cStringIO import StringIO
+from optparse import OptionParser
+import sys
+import time
+
+import splunk.results as results
+
+RESULT = """\t<result offset='%d'>
+\t\t<field k='_cd'>
+\t\t\t<value><text>0:%d</text></value>
+\t\t</field>
+\t\t<field k='_indextime'>
+\t\t\t<value><text>1303075291</text></value>
+\t\t</field>
+\t\t<field k='_raw'><v xml:space='preserve' trunc='0'>12.1.1.140 - - [08/Aug/2009:01:13:31 -0700] &quot;GET /favicon.ico HTTP/1.1&quot; <sg h='1'>404</sg> 170 &quot;-&quot; &quot;Mozilla/5.0 (Macintosh; U; PPC Mac OS X Mach-O; en-US)&quot;</v></field>
+\t\t<field k='_si'>
+\t\t\t<value><text>blovering.local</text></value>
+\t\t\t<value><text>main</text></value>
+\t\t</field>
+\t\t<field k='_time'>
+\t\t\t<value><text>2009-08-08 01:13:31.000 PDT</text></value>
+\t\t</field>
+\t\t<field k='host'>
+\t\t\t<value><text>blovering.local</text></value>
+\t\t</field>
+\t\t<field k='source'>
+\t\t\t<value><text>/var/log/apache/access.log</text></value>
+\t\t</field>
+\t</result>
+"""
+
+HEAD = """<?xml version='1.0' encoding='UTF-8'?>
+<results preview='0'>
+<meta>
+<fieldOrder>
+<field>_cd</field>
+<field>_indextime</field>
+<field>_raw</field>
+<field>_si</field>
+<field>_time</field>
+<field>host</field>
+<field>source</field>
+</fieldOrder>
+</meta>
+"""
+
+def generate(count):
+    """Generates an XML results document with the given number of rows."""
+    parts = [HEAD]
+    for offset in xrange(count): parts.append(RESULT % (offset, offset))
+    parts.append("</results>\n")
+    return "".join(parts)
+
+def measure(reader, text):
+    """Reads all rows of the given text with the given reader class and 
+       returns (rows, secs)."""
+    start = time.time()
+    reader = reader(StringIO(text))
+    rows = 0
+    while True:
+        kind = reader.read()
+        if kind is None: break
+        if kind == results.RESULT: rows += 1
+    return rows, time.time() - start
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("--rows", type="int", default=50000,
+        help="Number of rows to generate (default 50000)")
+    opts, _ = parser.parse_args(argv)
+
+    text = generate(opts.rows)
+    print "Reading %d rows (%d bytes)" % (opts.rows, len(text))
+
+    rates = {}
+    for reader in [results.ResultsReader, results.ExpatResultsReader]:
+        rows, secs = measure(reader, text)
+        assert rows == opts.rows
+        rates[reader] = rows / secs
+        print "%-20s %8.2f secs %10d rows/sec" % (
+            reader.__name__, secs, rates[reader])
+
+    print "Speedup: %.1fx" % (
+        rates[results.ExpatResultsReader] / rates[results.ResultsReader])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -25,6 +25,9 @@ files = [
     "test_data.py",
     "test_binding.py",
     "test_client.py",
+    "test_executor.py",
+    "test_nonblocking.py",
+    "test_results.py",
     "test_examples.py",
 ]
 
@@ -98,6 +98,8 @@ class ModuleTestCase(unittest.TestCase):
             "splunk.binding",
             "splunk.client",
             "splunk.data",
+            "splunk.executor",
+            "splunk.nonblocking",
             "splunk.results"
         ]
         for module in modules:
@@ -124,6 +126,7 @@ class ProtocolTestCase(unittest.TestCase):
 
         handlers = [
             binding.handler(),  # default handler
+            binding.pooled_handler(),
             urllib2_handler,
         ]
 
@@ -133,6 +136,20 @@ class ProtocolTestCase(unittest.TestCase):
                 body = context.get(path).body.read()
                 self.assertTrue(isatom(body))
     
+    def test_pooled(self):
+        global opts
+
+        handler = binding.pooled_handler(maxsize=2)
+        context = binding.connect(handler=handler, **opts.kwargs)
+        for i in range(10):
+            body = context.get("authentication/users").body.read()
+            self.assertTrue(isatom(body))
+        self.assertEqual(len(handler.pool), 1)
+
+        handler.pool.clear()
+        self.assertEqual(len(handler.pool), 0)
+        self.assertTrue(isatom(context.get("/services").body.read()))
+    
 class BindingTestCase(unittest.TestCase): # Base class
     def setUp(self):
         global opts
@@ -13,10 +13,14 @@
 # under the License.
 
 from os import path
+from StringIO import StringIO
 import sys
-from time import sleep
+import threading
+from time import sleep, time
 import unittest
+from urlparse import parse_qsl, urlparse
 
+import splunk.binding
 import splunk.client
 from splunk.binding import HTTPError
 import splunk.results as results
@@ -78,6 +82,12 @@ class ServiceTestCase(unittest.TestCase):
 
         service.apps.delete('sdk-tests')
         self.assertTrue('sdk-tests' not in service.apps.list())
+        self.assertFalse(service.apps.contains('sdk-tests'))
+        self.assertRaises(KeyError, service.apps.__getitem__, 'sdk-tests')
+
+        # Paging through the collection finds the same apps as listing it
+        names = [app.name for app in service.apps.iter(page_size=3)]
+        self.assertEqual(names, service.apps.list())
 
     def test_capabilities(self):
         expected = [
@@ -191,6 +201,31 @@ class ServiceTestCase(unittest.TestCase):
         wait_event_count(index, '3', 30)
         self.assertEqual(index['totalEventCount'], '3')
 
+        submitter = index.batch_submitter(max_events=2)
+        for i in range(3): submitter.submit("Batched event %d" % i)
+        submitter.close()
+        self.assertEqual(submitter.events, 3)
+        self.assertEqual(submitter.requests, 2)
+        wait_event_count(index, '6', 30)
+        self.assertEqual(index['totalEventCount'], '6')
+
+        writer = index.stream_writer(buffer_size=30)
+        for i in range(3): writer.write("Streamed event %d\n" % i)
+        writer.close()
+        self.assertEqual(writer.writes, 3)
+        self.assertEqual(writer.sends, 2)
+        wait_event_count(index, '9', 30)
+        self.assertEqual(index['totalEventCount'], '9')
+
+        writer = index.parallel_writer(connections=2)
+        for i in range(4): writer.write("Parallel event %d\n" % i)
+        writer.write("Keyed event\n", key="sdk-test")
+        writer.close()
+        self.assertEqual(writer.writes, 5)
+        self.assertEqual(writer.sends, 2)
+        wait_event_count(index, '14', 30)
+        self.assertEqual(index['totalEventCount'], '14')
+
         index.clean()
         self.assertEqual(index['totalEventCount'], '0')
 
@@ -231,6 +266,12 @@ class ServiceTestCase(unittest.TestCase):
         inputs.delete('tcp:9999')
         self.assertFalse(inputs.contains('tcp:9999'))
 
+        # Refreshing again, with or without the remembered missing kinds,
+        # finds the same inputs
+        keys = sorted(inputs.list())
+        self.assertEqual(sorted(self.service.inputs.list()), keys)
+        self.assertEqual(sorted(inputs.reset().refresh().list()), keys)
+
     def runjob(self, query, secs):
         """Create a job to run the given search and wait up to (approximately)
            the given number of seconds for it to complete.""" 
@@ -358,6 +399,63 @@ class ServiceTestCase(unittest.TestCase):
         self.assertEqual(results.RESULT, kind)
         self.assertEqual(int(result["count"]), 1)
 
+        # Page through the same results, reading ahead
+        rows = list(job.iter_results(page_size=1, prefetch=2))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(int(rows[0]["count"]), 1)
+
+        # And fetch them in parallel ranges, in and out of order
+        for ordered in [True, False]:
+            rows = list(job.fetch_all(workers=2, page_size=1, ordered=ordered))
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(int(rows[0]["count"]), 1)
+
+        # Wait on jobs, one at a time and as a group
+        job = self.service.jobs.create("search * | head 1").wait(timeout=60)
+        self.assertEqual(job['dispatchState'], "DONE")
+        jobs = [self.service.jobs.create("search * | head 1") for i in range(3)]
+        states = self.service.jobs.wait_all(jobs, timeout=60)
+        self.assertEqual(states, dict([(job.sid, "DONE") for job in jobs]))
+
+        # Run searches through a bounded, prioritized pool
+        pool = splunk.client.JobPool(self.service, max_concurrent=2)
+        try:
+            futures = [
+                pool.submit("search * | head 1", priority=i % 2)
+                for i in range(4)]
+            for future in futures:
+                rows = list(future.result(timeout=60))
+                self.assertEqual(len(rows), 1)
+                self.assertEqual(future.job['dispatchState'], "DONE")
+        finally:
+            pool.shutdown()
+        self.assertRaises(RuntimeError, pool.submit, "search * | head 1")
+
+        # Stream a search through the export endpoint, in each output mode
+        for output_mode in ["csv", "json", "xml"]:
+            stream = self.service.export(
+                "search * | head 1", output_mode=output_mode)
+            rows = list(stream)
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(stream.rows, 1)
+            self.assertTrue(stream.bytes > 0)
+        stream = self.service.export("search * | head 1")
+        stream.cancel()
+        self.assertTrue(stream.cancelled())
+        self.assertEqual(list(stream), [])
+
+        # Search the last hour in time slices, merged and unordered
+        latest = time()
+        earliest = latest - 3600
+        query = "search * | head 10"
+        rows = list(self.service.search_parallel(
+            query, earliest, latest, slices=3))
+        times = [splunk.client._timestamp(row['_time']) for row in rows]
+        self.assertEqual(times, sorted(times, reverse=True))
+        rows = list(self.service.search_parallel(
+            query, earliest, latest, slices=3, ordered=False))
+        self.assertEqual(len(rows), len(times))
+
     def test_loggers(self):
         service = self.service
 
@@ -442,6 +540,28 @@ class ServiceTestCase(unittest.TestCase):
         roles.delete("sdk-tester")
         self.assertTrue("sdk-tester" not in roles())
 
+        # Bulk operations report per item results, failing items don't
+        # stop the rest
+        names = ["sdk-tester%d" % i for i in range(5)]
+        results = roles.bulk_create(names)
+        self.assertEqual([result.ok for result in results], [True]*5)
+        self.assertEqual(results[1].value.name, names[1])
+        for name in names: self.assertTrue(name in roles())
+
+        results = roles.bulk_create([names[0], "sdk-tester5"])
+        self.assertEqual([result.ok for result in results], [False, True])
+        self.assertTrue(results[0].error is not None)
+        roles.delete("sdk-tester5")
+
+        results = roles.bulk_update(
+            dict([(name, {'srchJobsQuota': 7}) for name in names]))
+        for result in results: self.assertTrue(result.ok)
+        self.assertEqual(roles[names[2]]['srchJobsQuota'], "7")
+
+        results = roles.bulk_delete(names + ["sdk-tester-unknown"])
+        self.assertEqual([result.ok for result in results], [True]*5 + [False])
+        for name in names: self.assertTrue(name not in roles())
+
     def test_settings(self):
         settings = self.service.settings.read()
         keys = [
@@ -477,6 +597,260 @@ class ServiceTestCase(unittest.TestCase):
         users.delete("sdk-user")
         self.assertTrue("sdk-user" not in users())
 
+class CacheTestCase(unittest.TestCase):
+    def test_cache(self):
+        cache = splunk.client.TTLCache(maxsize=2, ttl=60, ttls={'list': 0})
+        cache.set(('entity', "apps/local/a/"), 1)
+        cache.set(('entity', "apps/local/b/"), 2)
+        self.assertEqual(cache.get(('entity', "apps/local/a/")), 1)
+
+        # The least recently used entry is evicted
+        cache.set(('entity', "apps/local/c/"), 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(('entity', "apps/local/b/")), None)
+        self.assertEqual(cache.get(('entity', "apps/local/a/")), 1)
+
+        # Entries of a kind with a zero TTL expire right away
+        cache.set(('list', "apps/local/"), ['a', 'c'])
+        self.assertEqual(cache.get(('list', "apps/local/")), None)
+
+        # Invalidating a path removes the entries above and below it
+        cache = splunk.client.TTLCache()
+        cache.set(('list', "apps/local/"), ['a', 'c'])
+        cache.set(('entity', "apps/local/a/"), 1)
+        cache.set(('entity', "apps/local/c/"), 3)
+        cache.invalidate("apps/local/a")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(('entity', "apps/local/c/")), 3)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+# A handler that answers entity reads from a canned feed, except for those
+# of entities named 'missing', and records the requested urls.
+class CannedHandler(object):
+    FEED = """<feed xmlns="http://www.w3.org/2005/Atom"
+                    xmlns:s="http://dev.splunk.com/ns/rest">
+                <entry>
+                  <title>x</title>
+                  <content type="text/xml">
+                    <s:dict><s:key name="a">1</s:key></s:dict>
+                  </content>
+                </entry>
+              </feed>"""
+
+    def __init__(self):
+        self.urls = []
+
+    def __call__(self, url, message, **kwargs):
+        self.urls.append(url)
+        if "/missing/" in url:
+            return { 'status': 404, 'reason': "Not Found", 'headers': [],
+                     'body': StringIO("<response/>") }
+        return { 'status': 200, 'reason': "OK", 'headers': [],
+                 'body': StringIO(self.FEED) }
+
+class ContainsTestCase(unittest.TestCase):
+    def test_contains(self):
+        handler = CannedHandler()
+        roles = splunk.client.Service(handler=handler).roles
+        self.assertFalse(roles.contains(""))
+        self.assertEqual(handler.urls, [])
+        self.assertTrue(roles.contains("a b/c"))
+        self.assertTrue(handler.urls[-1].endswith(
+            "/authentication/roles/a+b%2Fc/"))
+        self.assertFalse(roles.contains("missing"))
+        self.assertRaises(KeyError, roles.__getitem__, "missing")
+
+    def test_cached(self):
+        # Lookups and reads of a cached item share a single request
+        handler = CannedHandler()
+        service = splunk.client.Service(
+            handler=handler, cache=splunk.client.TTLCache())
+        roles = service.roles
+        self.assertTrue(roles.contains("x"))
+        self.assertTrue(roles.contains("x"))
+        role = roles["x"]
+        self.assertEqual(role["a"], "1")
+        self.assertEqual(role.read().a, "1")
+        self.assertEqual(len(handler.urls), 1)
+
+        # Until an update invalidates it
+        role.update(a="1")
+        self.assertEqual(roles["x"]["a"], "1")
+        self.assertEqual(len(handler.urls), 3)
+
+        # Without a cache every lookup is a request
+        roles = splunk.client.Service(handler=handler).roles
+        self.assertEqual(roles["x"]["a"], "1")
+        self.assertEqual(len(handler.urls), 5)
+
+class WaitTestCase(unittest.TestCase):
+    def test_wait_all(self):
+        # The listing has job 'a', job 'b' is read on its own, and job 'c'
+        # doesn't exist
+        def handler(url, message, **kwargs):
+            if url.endswith("/search/jobs/?count=0"):
+                body = """<feed xmlns="http://www.w3.org/2005/Atom"
+                                xmlns:s="http://dev.splunk.com/ns/rest">
+                            <entry><title>a</title><content type="text/xml">
+                              <s:dict>
+                                <s:key name="sid">a</s:key>
+                                <s:key name="dispatchState">DONE</s:key>
+                              </s:dict>
+                            </content></entry>
+                          </feed>"""
+            elif url.endswith("/search/jobs/b/"):
+                body = """<entry xmlns="http://www.w3.org/2005/Atom"
+                                 xmlns:s="http://dev.splunk.com/ns/rest">
+                            <title>b</title><content type="text/xml">
+                              <s:dict>
+                                <s:key name="dispatchState">DONE</s:key>
+                              </s:dict>
+                            </content>
+                          </entry>"""
+            else:
+                return { 'status': 404, 'reason': "Not Found",
+                         'headers': [], 'body': StringIO("<response/>") }
+            return { 'status': 200, 'reason': "OK", 'headers': [],
+                     'body': StringIO(body) }
+        jobs = splunk.client.Service(handler=handler).jobs
+        self.assertEqual(jobs.wait_all(["a", "b", "c"], timeout=1),
+            {'a': "DONE", 'b': "DONE", 'c': "FAILED"})
+
+class PooledTestCase(unittest.TestCase):
+    def test_pooled(self):
+        # The stock handler is replaced by a pooled one
+        service = splunk.client.Service()
+        pooled = service.pooled(2)
+        self.assertTrue(pooled is not service)
+        self.assertEqual(pooled.http.handler.pool.maxsize, 2)
+        self.assertTrue(pooled.pooled() is pooled)
+
+        # The handler's options carry over to the pooled handler
+        service = splunk.client.Service(
+            handler=splunk.binding.handler(timeout=5))
+        pooled = service.pooled()
+        self.assertEqual(pooled.http.handler.options['timeout'], 5)
+        self.assertEqual(pooled.http.handler.options['key_file'], None)
+
+        # A custom handler is used as is
+        def handler(url, message, **kwargs):
+            raise AssertionError("Unexpected request")
+        service = splunk.client.Service(handler=handler)
+        self.assertTrue(service.pooled() is service)
+
+# An index whose attached streams record the data sent on them, except
+# that a send of data starting with "bad" fails once release is set.
+class CannedIndex(object):
+    def __init__(self):
+        self.sent = []
+        self.release = threading.Event()
+
+    def attach(self, **kwargs):
+        index = self
+        class Stream(object):
+            def close(self):
+                pass
+            def sendall(self, data):
+                if data.startswith("bad"):
+                    index.release.wait()
+                    raise IOError("Expected")
+                index.sent.append(data)
+        return Stream()
+
+class StreamWriterTestCase(unittest.TestCase):
+    def test_error(self):
+        index = CannedIndex()
+        writer = splunk.client.StreamWriter(index, buffer_size=1, retries=0)
+        writer.write("a\n")
+        writer.flush()
+        self.assertEqual(index.sent, ["a\n"])
+
+        # The failed buffer and those queued behind it are dropped, and
+        # the error sticks
+        writer.write("bad\n")
+        writer.write("c\n")
+        index.release.set()
+        self.assertRaises(IOError, writer.flush)
+        self.assertEqual(writer.dropped, 6)
+        self.assertRaises(IOError, writer.write, "d\n")
+        self.assertRaises(IOError, writer.close)
+        self.assertEqual(index.sent, ["a\n"])
+
+class MergeTestCase(unittest.TestCase):
+    def test_timestamp(self):
+        timestamp = splunk.client._timestamp
+        self.assertEqual(timestamp("1318438800.5"), 1318438800.5)
+        self.assertEqual(
+            timestamp("2011-10-12T10:00:00.500-07:00"), 1318438800.5)
+        self.assertEqual(timestamp("2011-10-12T17:00:00Z"), 1318438800)
+        self.assertEqual(timestamp("2011-10-12 17:00:00.500 UTC"), 1318438800.5)
+        self.assertRaises(ValueError, timestamp, "yesterday")
+
+    def test_merge(self):
+        slices = [[5, 3, 1], [6, 2], [], [4]]
+        streams = [
+            iter([{'_time': str(t), 'slice': i} for t in times])
+            for i, times in enumerate(slices)]
+        rows = list(splunk.client._merge(streams))
+        self.assertEqual([row['_time'] for row in rows],
+            ["6", "5", "4", "3", "2", "1"])
+        self.assertEqual([row['slice'] for row in rows], [1, 0, 3, 0, 1, 0])
+
+        # Slices with times in Splunk's default format
+        slices = [
+            ["2009-08-08 01:13:31.000 PDT", "2009-08-08 01:13:29.500 PDT"],
+            ["2009-08-08 01:13:30.000 PDT"],
+            ["2009-08-08 01:13:29.000 PDT", "2009-08-07 23:59:59.000 PDT"]]
+        streams = [iter([{'_time': t} for t in times]) for times in slices]
+        rows = list(splunk.client._merge(streams))
+        self.assertEqual([row['_time'] for row in rows], sorted(
+            [t for times in slices for t in times], reverse=True))
+
+    def test_parallel(self):
+        # Each slice of [0, 300) has rows a second apart, newest first, and
+        # the bodies of the exports are recorded
+        bodies = []
+        class Body(StringIO):
+            def close(self):
+                self.closed = True
+        def handler(url, message, **kwargs):
+            query = dict(parse_qsl(urlparse(url).query))
+            earliest = float(query['earliest_time'])
+            latest = float(query['latest_time'])
+            if earliest == self.failing:
+                return { 'status': 404, 'reason': "Not Found",
+                         'headers': [], 'body': StringIO("<response/>") }
+            rows = "".join([
+                "<result offset='%d'><field k='_time'><value><text>%r"
+                "</text></value></field></result>" % (i, latest - i - 1)
+                for i in range(int(latest - earliest))])
+            body = Body("<results preview='0'>%s</results>" % rows)
+            body.closed = False
+            bodies.append(body)
+            return { 'status': 200, 'reason': "OK", 'headers': [],
+                     'body': body }
+        service = splunk.client.Service(handler=handler)
+
+        self.failing = None
+        rows = list(service.search_parallel("search *", 0, 300, slices=3))
+        self.assertEqual([float(row['_time']) for row in rows],
+            range(299, -1, -1))
+        self.assertTrue(all([body.closed for body in bodies]))
+
+        rows = list(service.search_parallel(
+            "search *", 0, 300, slices=3, ordered=False))
+        self.assertEqual(len(rows), 300)
+
+        # A slice whose export fails cancels those already started
+        del bodies[:]
+        self.failing = 100.0
+        self.assertRaises(HTTPError, list,
+            service.search_parallel("search *", 0, 300, slices=3))
+        self.assertEqual(len(bodies), 1)
+        self.assertTrue(bodies[0].closed)
+
 def runone(testname):
     suite = unittest.TestSuite()
     suite.addTest(ServiceTestCase(testname))
@@ -13,6 +13,7 @@
 # under the License.
 
 from os import path
+from StringIO import StringIO
 import sys
 import unittest
 
@@ -76,6 +77,26 @@ class TestCase(unittest.TestCase):
         self.assertEqual(result,
             {'e1': {'a1': 'v1', 'e2': {'$text': 'v2', 'a1': 'v1'}}})
 
+    def test_iterload(self):
+        self.assertEqual(list(data.iterload(StringIO(""))), [])
+        self.assertEqual(list(data.iterload(StringIO(" \r\n\t"))), [])
+
+        # Only a blank stream is empty, other parse errors are raised
+        for text in ["Not Found", "<?xml version='1.0'?>", "<a", "<a>"]:
+            self.assertRaises(SyntaxError, list, data.iterload(StringIO(text)))
+
+        result = data.iterload(StringIO("<a><b>1</b><c/><b>2</b></a>"), "b")
+        self.assertEqual(list(result), [{'b': '1'}, {'b': '2'}])
+
+        testpath = path.dirname(path.abspath(__file__))
+        fh = open(path.join(testpath, "services.xml"), 'r')
+        text = fh.read()
+        fh.close()
+        expected = data.load(text, "{http://www.w3.org/2005/Atom}entry")
+        result = list(data.iterload(StringIO(text)))
+        self.assertEqual(result, expected)
+        self.assertEqual(result[0].entry.title, 'alerts')
+
     def test_real(self):
         """Test some real Splunk response examples."""
         testpath = path.dirname(path.abspath(__file__))
@@ -12,13 +12,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import bz2
+from collections import deque
 import difflib
+import gzip
 import os
 from pprint import pprint
+import shutil
+from StringIO import StringIO
 from subprocess import PIPE, Popen
+import tempfile
 import time
 import unittest 
 import sys
+from zlib import crc32
 
 import splunk.client
 
@@ -83,6 +90,9 @@ class ExamplesTestCase(unittest.TestCase):
         result = run("async/async.py sync")
         self.assertEquals(result, 0)
 
+        result = run("async/async.py nonblocking")
+        self.assertEquals(result, 0)
+
         try:
             # Only try running the async version of the test if eventlet
             # is present on the system
@@ -288,6 +298,7 @@ class ExamplesTestCase(unittest.TestCase):
         
         tracker.track("test_event", distinct_id="abc123", foo="bar", abc="123")
         tracker.track("test_event", distinct_id="123abc", abc="12345")
+        tracker.close()
 
         # Wait until the events get indexed
         wait_event_count(index, 2, 10)
@@ -342,6 +353,223 @@ class ExamplesTestCase(unittest.TestCase):
         # Now that we're done, we'll clean the index 
         index.clean()
  
+# A handler that answers the analytics retriever's requests with a canned
+# session, job and timechart results.
+def analytics_handler(results):
+    def request(url, message, **kwargs):
+        if url.endswith("/auth/login"):
+            body = "<response><sessionKey>123</sessionKey></response>"
+        elif url.endswith("/search/jobs/"):
+            body = "<response><sid>1234.5</sid></response>"
+        else:
+            body = results
+        return { 'status': 200, 'reason': "OK", 'headers': [],
+                 'body': StringIO(body) }
+    return request
+
+TIMECHART = """<?xml version='1.0' encoding='UTF-8'?>
+<results preview='0'>
+<meta><fieldOrder><field>_time</field><field>a</field><field>b</field></fieldOrder></meta>
+<result offset='0'>
+    <field k='_time'><value><text>2011-10-01T00:00:00.000-07:00</text></value></field>
+    <field k='a'><value><text>3</text></value></field>
+    <field k='b'><value><text>%s</text></value></field>
+</result>
+<result offset='1'>
+    <field k='_time'><value><text>2011-11-01T00:00:00.000-07:00</text></value></field>
+    <field k='a'><value><text>5</text></value></field>
+</result>
+</results>
+"""
+
+class AnalyticsTestCase(unittest.TestCase):
+    def test_events_over_time(self):
+        sys.path.append(os.getcwd())
+        import analytics
+
+        retriever = analytics.output.AnalyticsRetriever(
+            "sdk-test", { 'handler': analytics_handler(TIMECHART % "1") })
+        over_time = retriever.events_over_time()
+        self.assertEqual(sorted(over_time.keys()), ["a", "b"])
+        self.assertEqual(over_time["a"], [
+            { 'count': 3, 'time': "2011-10-01T00:00:00.000-07:00" },
+            { 'count': 5, 'time': "2011-11-01T00:00:00.000-07:00" }])
+        self.assertEqual([item['count'] for item in over_time["b"]], [1, 0])
+
+        # A count that isn't a number is reported with its field
+        retriever = analytics.output.AnalyticsRetriever(
+            "sdk-test", { 'handler': analytics_handler(TIMECHART % "x") })
+        try:
+            retriever.events_over_time()
+            self.fail("ValueError not raised")
+        except ValueError as e:
+            self.assertTrue("Field b " in str(e))
+
+# The options of an export, as parsed by export.py's main.
+class ExportOptions(object):
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+# A stream that returns each of the given parts in a read of its own.
+class PartStream(object):
+    def __init__(self, parts):
+        self.parts = list(parts)
+
+    def read(self, size):
+        return self.parts.pop(0) if self.parts else ""
+
+# Decompress the given data, which is a sequence of gzip or bz2 members.
+def decompress(data, mode):
+    if mode == "gzip":
+        return gzip.GzipFile(fileobj=StringIO(data)).read()
+    result = ""
+    while data:
+        decompressor = bz2.BZ2Decompressor()
+        result += decompressor.decompress(data)
+        data = decompressor.unused_data
+    return result
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        sys.path.append(os.path.join(os.getcwd(), "export"))
+        self.export = __import__("export")
+        self.dir = tempfile.mkdtemp()
+        self.journal = os.path.join(self.dir, "journal")
+        self.output = os.path.join(self.dir, "export.out")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def options(self, omode="csv", compress=None):
+        return ExportOptions(output=self.output, omode=omode,
+                             compress=compress, index="main")
+
+    # Export the given buckets, each of which is (bucket, text), to the
+    # export file, journaling them as they are committed.
+    def write(self, options, buckets, mode="w"):
+        self.export.open_output(options, mode)
+        rfd = open(self.journal, "a")
+        header = False
+        for bucket, text in buckets:
+            header, _ = self.export.write_bucket(
+                options, PartStream([text]), header)
+            self.export.commit_bucket(options, rfd, bucket)
+        rfd.close()
+        return options.kwargs['fd']
+
+    def test_journal(self):
+        fd = open(self.journal, "wb")
+        fd.write("3,1000,1\n3,1001,1,120,7\n3,1002,1,9")
+        fd.close()
+
+        # A torn entry is dropped from the journal, older entries have no
+        # offset or checksum
+        entries = self.export.read_journal(self.journal)
+        self.assertEqual(entries,
+            [((3, 1000, 1), None, None), ((3, 1001, 1), 120, 7)])
+        self.assertEqual(open(self.journal, "rb").read(),
+                         "3,1000,1\n3,1001,1,120,7\n")
+        self.assertEqual(self.export.read_journal(self.journal), entries)
+
+    def test_truncate(self):
+        options = self.options()
+        self.write(options, [
+            ((2, 1000, 1), "_time,n\r\n1000,0\r\n1000,1\r\n"),
+            ((1, 1001, 1), "_time,n\r\n1001,0\r\n")]).close()
+        committed = open(self.output, "rb").read()
+        self.assertEqual(committed,
+            "_time,n\n1000,0\r\n1000,1\r\n1001,0\r\n")
+
+        # The part of a bucket written past the last commit is truncated
+        fd = open(self.output, "ab")
+        fd.write("1002,0\r\n1002")
+        fd.close()
+        entries = self.export.read_journal(self.journal)
+        self.assertEqual([entry[0] for entry in entries],
+                         [(2, 1000, 1), (1, 1001, 1)])
+        self.assertTrue(self.export.truncate_export(options, entries))
+        self.assertEqual(open(self.output, "rb").read(), committed)
+
+        # A last bucket that doesn't match its checksum isn't
+        fd = open(self.output, "r+b")
+        fd.seek(-3, 2)
+        fd.write("X")
+        fd.close()
+        self.assertFalse(self.export.truncate_export(options, entries))
+        self.assertEqual(len(open(self.output, "rb").read()), len(committed))
+
+        # Nor is an export that is missing committed data
+        fd = open(self.output, "r+b")
+        fd.truncate(len(committed) - 1)
+        fd.close()
+        self.assertFalse(self.export.truncate_export(options, entries))
+
+        # Without an export file, only an empty journal is consistent
+        os.remove(self.output)
+        self.assertFalse(self.export.truncate_export(options, entries))
+        self.assertTrue(self.export.truncate_export(options, []))
+
+    def test_write_bucket(self):
+        # The csv header is written once, the xml declaration of every
+        # bucket is kept and the leading bracket of json is dropped
+        for omode, parts, header, expected in [
+            ("csv", ["a,b\n", "1,2\n3,4"], False, "a,b\n1,2\n3,4\n"),
+            ("csv", ["a,b\r\n1,2\r\n"], True, "1,2\r\n"),
+            ("xml", ["<?xml?>\n<results/>"], False, "<?xml?>\n<results/>\n"),
+            ("json", ["[\n", '{"a":1}\n'], False, '{"a":1}\n')]:
+            options = ExportOptions(fd=StringIO(), omode=omode)
+            size = sum([len(part) for part in parts])
+            self.assertEqual(
+                self.export.write_bucket(options, PartStream(parts), header),
+                (header or omode == "csv", size))
+            self.assertEqual(options.kwargs['fd'].getvalue(), expected)
+
+        options = ExportOptions(fd=StringIO(), omode="csv")
+        self.assertEqual(
+            self.export.write_bucket(options, PartStream([]), False),
+            (False, 0))
+        self.assertEqual(options.kwargs['fd'].getvalue(), "")
+
+    def test_compressed(self):
+        buckets = [
+            ((2, 1000, 1), "_time,n\r\n" + "1000,%s\r\n" % ("x"*5000) * 2),
+            ((1, 1001, 1), "_time,n\r\n1001,0\r\n")]
+        plain = "_time,n\n" + "".join(
+            [text[text.find("\n")+1:] for _, text in buckets])
+        for compress in [None, "gzip", "bz2"]:
+            if os.path.exists(self.journal): os.remove(self.journal)
+            self.write(self.options(compress=compress), buckets).close()
+            data = open(self.output, "rb").read()
+            entries = self.export.read_journal(self.journal)
+            if compress is None:
+                self.assertEqual(data, plain)
+                self.assertEqual(entries[-1][2],
+                    crc32(data[entries[0][1]:]) & 0xffffffff)
+                continue
+            # Each bucket is a member of its own, which ends at its commit
+            self.assertEqual(decompress(data, compress), plain)
+            self.assertEqual(decompress(data[:entries[0][1]], compress),
+                             plain[:plain.find("1001")])
+            self.assertEqual(entries[-1][1], len(data))
+
+    def test_plan_request(self):
+        export = self.export
+        # Buckets are requested as is until a request has been measured
+        sizer = export.BucketSizer(10, duration=1)
+        buckets = deque([(3, 0, 60), (4, 60, 60), (5, 120, 60)])
+        self.assertEqual(
+            export.plan_request(self.options(), None, sizer, buckets),
+            (3, 0, 60))
+
+        # Then following buckets are merged while they fit the target
+        sizer.observe(5, 500, 1.0)
+        self.assertEqual(sizer.target(), 5)
+        buckets.appendleft((1, 0, 60))
+        self.assertEqual(
+            export.plan_request(self.options(), None, sizer, buckets),
+            (5, 0, 120))
+        self.assertEqual(list(buckets), [(5, 120, 60)])
+
 # When an event is submitted to an index it takes a while before the event
 # is registered by the index's totalEventCount.
 def wait_event_count(index, count, secs):
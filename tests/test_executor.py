@@ -0,0 +1,100 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+from time import sleep
+import unittest
+
+import splunk.executor
+from splunk.executor import CancelledError, Executor, Future, TimeoutError
+
+class TestCase(unittest.TestCase):
+    def test_future(self):
+        future = Future()
+        self.assertFalse(future.done())
+        self.assertRaises(TimeoutError, future.result, 0.01)
+        called = []
+        future.add_done_callback(called.append)
+        future.set_result(42)
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), 42)
+        self.assertEqual(called, [future])
+        self.assertFalse(future.cancel())
+
+        future = Future()
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            future.set_exception()
+        self.assertTrue(isinstance(future.exception(), ValueError))
+        self.assertRaises(ValueError, future.result)
+
+        future = Future()
+        self.assertTrue(future.cancel())
+        self.assertTrue(future.cancelled())
+        self.assertRaises(CancelledError, future.result)
+
+    def test_executor(self):
+        active = [0, 0] # Current, maximum
+        lock = threading.Lock()
+        def work(value):
+            lock.acquire()
+            active[0] += 1
+            active[1] = max(active)
+            lock.release()
+            sleep(0.01)
+            lock.acquire()
+            active[0] -= 1
+            lock.release()
+            return value * 2
+
+        executor = Executor(3)
+        futures = [executor.submit(work, i) for i in range(20)]
+        self.assertEqual([f.result() for f in futures], range(0, 40, 2))
+        self.assertTrue(active[1] <= 3)
+        self.assertEqual(list(executor.map(work, range(5))), range(0, 10, 2))
+
+        future = executor.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result)
+
+        executor.shutdown()
+        self.assertRaises(RuntimeError, executor.submit, work, 1)
+
+    def test_cancel(self):
+        event = threading.Event()
+        executor = Executor(1)
+        blocker = executor.submit(event.wait)
+        queued = executor.submit(lambda: 1)
+        self.assertTrue(queued.cancel())
+        event.set()
+        blocker.result()
+        self.assertRaises(CancelledError, queued.result)
+        executor.shutdown()
+
+    def test_shutdown_all(self):
+        # Shutting down at exit doesn't wait on a hung call
+        event = threading.Event()
+        executor = Executor(1)
+        blocker = executor.submit(event.wait)
+        timer = threading.Timer(5, event.set) # Unblock it should it wait
+        timer.start()
+        splunk.executor.shutdown_all()
+        self.assertFalse(blocker.done())
+        timer.cancel()
+        self.assertRaises(RuntimeError, executor.submit, event.wait)
+        event.set()
+        blocker.result()
+
+if __name__ == "__main__":
+    unittest.main()
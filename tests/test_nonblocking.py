@@ -0,0 +1,304 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import socket
+from SocketServer import ThreadingMixIn
+import sys
+import threading
+import time
+import unittest
+import urlparse
+from xml.etree.ElementTree import XML
+
+from splunk.binding import HTTPError
+import splunk.data as data
+from splunk.data import record
+from splunk.nonblocking import AsyncContext, AsyncService, BodyStream
+from splunk.nonblocking import BUFFER_LIMIT, gather, Loop
+from splunk.nonblocking import Operation, Return
+import splunk.results as results
+
+from utils import parse
+
+opts = None # Command line options
+
+class LoopTestCase(unittest.TestCase):
+    def test_coroutines(self):
+        loop = Loop()
+
+        def add(a, b):
+            yield loop.sleep(0.01)
+            raise Return(a + b)
+
+        def outer():
+            values = yield [loop.spawn(add(i, i)) for i in range(10)]
+            raise Return(sum(values))
+
+        self.assertEqual(loop.run(loop.spawn(outer())), 90)
+
+        def fail():
+            yield loop.sleep(0)
+            raise ValueError("Expected")
+
+        self.assertRaises(ValueError, loop.run, loop.spawn(fail()))
+
+# An AsyncService that answers job requests from canned bodies, so that
+# its helpers can be run through the loop without a server.
+class CannedService(AsyncService):
+    RESPONSES = {
+        "search/jobs/": """<response><sid>1234.5</sid></response>""",
+        "search/jobs/1234.5": """
+            <entry xmlns="http://www.w3.org/2005/Atom"
+                   xmlns:s="http://dev.splunk.com/ns/rest">
+              <title>search *</title>
+              <content type="text/xml">
+                <s:dict><s:key name="isDone">1</s:key></s:dict>
+              </content>
+            </entry>""",
+    }
+
+    def _respond(self, path):
+        result = Operation()
+        def complete(_):
+            body = BodyStream()
+            body._feed(self.RESPONSES[path])
+            body._finish()
+            result.set_result(record({
+                'status': 200, 'reason': "OK", 'headers': [], 'body': body}))
+        self.loop.sleep(0).add_callback(complete)
+        return result
+
+    def get(self, path, **kwargs):
+        return self._respond(path)
+
+    def post(self, path, **kwargs):
+        return self._respond(path)
+
+class JobTestCase(unittest.TestCase):
+    def test_jobs(self):
+        loop = Loop()
+        service = CannedService(loop=loop)
+
+        def search():
+            sid = yield service.create_job("search *")
+            job = yield service.read_job(sid)
+            raise Return((sid, job))
+
+        sid, job = loop.run(loop.spawn(search()))
+        self.assertEqual(sid, "1234.5")
+        self.assertEqual(job.isDone, "1")
+
+# Answers the local test server's requests: /length?n=N sends N bytes
+# with a Content-Length, /chunked sends CHUNKS with a chunked encoding,
+# /slow sends its response after a second, and /stale does the same as
+# /length but then, once the client has gone idle, drops the connection
+# without saying so, as a server that times out an idle keep-alive
+# connection would.
+CHUNKS = ["abc", "defghijk", "l" * 5000]
+
+class LocalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader("content-length", 0)))
+        self._respond(True)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, send_body):
+        self.server.clients.append(self.client_address)
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        if url.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in CHUNKS:
+                self.wfile.write("%x;ext=1\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write("0\r\nX-Trailer: 1\r\n\r\n")
+            return
+        if url.path == "/slow": time.sleep(1)
+        body = "x" * int(query.get('n', 10))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body: self.wfile.write(body)
+        if url.path == "/stale":
+            time.sleep(0.1)
+            self.close_connection = 1
+
+class LocalServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), LocalHandler)
+        self.clients = [] # The client address of each request served
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+# Exercises the client against a local server, so that it runs offline.
+class ClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer()
+        self.loop = Loop()
+        self.context = self.connect()
+
+    def tearDown(self):
+        self.context.close()
+        self.server.stop()
+
+    def connect(self, **kwargs):
+        return AsyncContext(loop=self.loop, scheme="http", host="127.0.0.1",
+            port=self.server.server_address[1], **kwargs)
+
+    def fetch(self, operation):
+        return self.loop.run(self.loop.spawn(self.read(operation)))
+
+    def read(self, operation):
+        response = yield operation
+        body = yield response.body.readall()
+        raise Return(body)
+
+    def test_backpressure(self):
+        size = 3 * BUFFER_LIMIT
+        response = self.loop.run(self.context.get("/length", n=size))
+        # The body is held back until it is read, so running the loop
+        # returns rather than waiting on it.
+        self.loop.run()
+        self.assertTrue(BUFFER_LIMIT <= response.body.buffered < size)
+        self.assertRaises(RuntimeError, self.loop.run, Operation())
+        self.assertEqual(len(self.loop.run(response.body.readall())), size)
+
+    def test_chunked(self):
+        self.assertEqual(self.fetch(self.context.get("/chunked")),
+                         "".join(CHUNKS))
+        self.assertEqual(self.fetch(self.context.get("/length")), "x"*10)
+        self.assertEqual(len(set(self.server.clients)), 1)
+
+    def test_head(self):
+        self.assertEqual(self.fetch(self.context.request(
+            "/length?n=100", { 'method': "HEAD" })), "")
+        self.assertEqual(self.fetch(self.context.get("/length")), "x"*10)
+        self.assertEqual(len(set(self.server.clients)), 1)
+
+    def test_pooling(self):
+        for n in [0, 10, 100000]:
+            self.assertEqual(self.fetch(self.context.get("/length", n=n)),
+                             "x"*n)
+        self.assertEqual(len(set(self.server.clients)), 1)
+
+    def test_queueing(self):
+        context = self.connect(maxsize=1)
+        bodies = self.loop.run(gather([
+            self.loop.spawn(self.read(context.get("/length", n=n)))
+            for n in range(1, 6)]))
+        self.assertEqual(bodies, ["x"*n for n in range(1, 6)])
+        self.assertEqual(len(set(self.server.clients)), 1)
+        context.close()
+
+    def test_timeout(self):
+        context = self.connect(timeout=0.2)
+        self.assertRaises(socket.timeout, self.fetch, context.get("/slow"))
+        self.assertEqual(self.fetch(context.get("/length")), "x"*10)
+        context.close()
+
+    # A GET is retried when a pooled connection turns out to have been
+    # dropped by the server, but a POST that was sent may have been acted
+    # on, so it isn't.
+    def test_stale(self):
+        self.assertEqual(self.fetch(self.context.get("/stale")), "x"*10)
+        time.sleep(0.3)
+        self.assertEqual(self.fetch(self.context.get("/length")), "x"*10)
+        self.assertEqual(len(set(self.server.clients)), 2)
+
+        self.fetch(self.context.get("/stale"))
+        time.sleep(0.3)
+        self.assertRaises(socket.error,
+            self.fetch, self.context.post("/length", n=10))
+
+class ServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        global opts
+        self.loop = Loop()
+        self.service = AsyncService(loop=self.loop, **opts.kwargs)
+        self.loop.run(self.service.login())
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_get(self):
+        def users():
+            response = yield self.service.get("authentication/users")
+            self.assertEqual(response.status, 200)
+            body = yield response.body.readall()
+            raise Return(XML(body).tag)
+
+        tags = self.loop.run(gather(
+            [self.loop.spawn(users()) for i in range(20)]))
+        self.assertEqual(len(tags), 20)
+        for tag in tags: 
+            self.assertEqual(tag, "{http://www.w3.org/2005/Atom}feed")
+
+    def test_error(self):
+        operation = self.service.get("authentication/users/__nobody__")
+        try:
+            self.loop.run(operation)
+            self.fail("HTTPError not raised")
+        except HTTPError as e:
+            self.assertEqual(e.status, 404)
+
+    def test_jobs(self):
+        service = self.service
+
+        def search(query):
+            sid = yield service.create_job(query, exec_mode="blocking")
+            job = yield service.read_job(sid)
+            self.assertEqual(job.isDone, '1')
+            response = yield service.job_results(sid)
+            body = yield response.body.readall()
+            yield service.cancel_job(sid)
+            raise Return(body)
+
+        queries = ["search * | head 1 | stats count"] * 4
+        bodies = self.loop.run(gather(
+            [self.loop.spawn(search(query)) for query in queries]))
+        for body in bodies:
+            reader = results.ResultsReader(results.ListStream(body))
+            kind, _ = reader.next()
+            self.assertEqual(kind, results.RESULTS)
+            kind, result = reader.next()
+            self.assertEqual(kind, results.RESULT)
+            self.assertEqual(int(result['count']), 1)
+
+def main():
+    global opts
+    opts = parse(sys.argv[1:], {}, ".splunkrc")
+    # Don't pass the Splunk cmdline args to unittest
+    unittest.main(argv=sys.argv[:1])
+
+if __name__ == "__main__":
+    main()
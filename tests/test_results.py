@@ -0,0 +1,282 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from array import array
+import math
+from os import path
+from StringIO import StringIO
+import unittest
+
+import splunk.results as results
+
+# A small results document exercising multiple sections, messages, 
+# multi-valued fields, whitespace, entities and <v> (raw) values.
+SAMPLE = """<?xml version='1.0' encoding='UTF-8'?>
+<results preview='1'>
+<meta><fieldOrder><field>a</field><field>b</field></fieldOrder></meta>
+<messages><msg type="WARN">careful &amp; "quoted"</msg></messages>
+<result offset='0'>
+    <field k='a'><value h='1'><text> 1 &lt;2 </text></value></field>
+    <field k='b'>
+        <value><text>x</text></value>
+        <value><text></text></value>
+        <value><text>   </text></value>
+    </field>
+    <field k='_raw'><v xml:space='preserve' trunc='0'>a &quot;b&quot; <sg h='1'>c&gt;</sg><e/> &apos;\xc3\xa9 <![CDATA[<z>]]></v></field>
+</result>
+<result offset='1'><field k='a'><value><text>\xc3\xa9</text></value></field></result>
+</results>
+<results preview='0'>
+<meta><fieldOrder><field>c</field></fieldOrder></meta>
+<result offset='0'><field k='c'><value><text>3</text></value></field></result>
+</results>
+"""
+
+# Results in the output_mode=json form, followed by a preview section in the
+# row per line form used by the export endpoint.
+SAMPLE_JSON = """{"preview": false, "init_offset": 0,
+"messages": [{"type": "INFO", "text": "hello"}],
+"fields": [{"name": "a"}, {"name": "b"}],
+"results": [{"a": "1", "b": ["x", "y"]}, {"a": "\\u00e9", "b": null}]}
+{"preview": true, "offset": 0, "result": {"c": "3"}}
+{"preview": true, "offset": 1, "result": {"c": ["4"]}}
+"""
+
+SAMPLE_CSV = """a,b,__mv_b\r
+1,"x,y",\r
+2,x,$x$;$$y$\r
+\r
+a,b,__mv_b\r
+"3
+4",,\r
+"""
+
+class ChunkStream(object):
+    """A stream that returns at most size bytes per read."""
+    def __init__(self, text, size=7):
+        self._stream = StringIO(text)
+        self._size = size
+
+    def read(self, size=None):
+        return self._stream.read(self._size)
+
+class PartStream(object):
+    """A stream that returns each of the given parts in a read of its own."""
+    def __init__(self, parts):
+        self._parts = list(parts)
+
+    def read(self, size=None):
+        return self._parts.pop(0) if self._parts else ""
+
+class TruncatedStream(ChunkStream):
+    """A stream that fails when read past the end of its text."""
+    def read(self, size=None):
+        chunk = ChunkStream.read(self, size)
+        if not chunk: raise AssertionError("Read past the end of the stream")
+        return chunk
+
+def readall(reader):
+    """Returns a list of (kind, value, fields) for each item read."""
+    items = []
+    while True:
+        kind = reader.read()
+        if kind is None: break
+        items.append((kind, reader.value, list(reader.fields)))
+    return items
+
+class TestCase(unittest.TestCase):
+    def check(self, text):
+        expected = readall(results.ResultsReader(StringIO(text)))
+        actual = readall(results.ExpatResultsReader(StringIO(text)))
+        self.assertEqual(actual, expected)
+        return actual
+
+    def test_empty(self):
+        self.assertEqual(self.check(""), [])
+        self.assertEqual(self.check("  \n"), [])
+
+    def test_file(self):
+        testpath = path.dirname(path.abspath(__file__))
+        fh = open(path.join(testpath, "results200.xml"), 'r')
+        text = fh.read()
+        fh.close()
+        items = self.check(text)
+        self.assertEqual(items[0][0], results.RESULTS)
+        self.assertEqual(items[1][0], results.MESSAGE)
+
+    def test_sample(self):
+        items = self.check(SAMPLE)
+        kinds = [kind for kind, _, _ in items]
+        self.assertEqual(kinds, [
+            results.RESULTS, results.MESSAGE, results.RESULT, 
+            results.RESULT, results.RESULTS, results.RESULT])
+        kind, value, fields = items[2]
+        self.assertEqual(fields, ['a', 'b'])
+        self.assertEqual(value['a'], " 1 <2 ")
+        self.assertEqual(value['b'], ["x", "", ""])
+        self.assertEqual(value['$offset'], "0")
+        self.assertEqual(value['_raw'], 
+            '<v trunc="0" xml:space="preserve">a &quot;b&quot; '
+            '<sg h="1">c&gt;</sg><e/> \'\xc3\xa9 &lt;z&gt;</v>')
+        self.assertEqual(items[5][2], ['c'])
+
+    def test_export(self):
+        # The export endpoint repeats the XML declaration for each section
+        decl = "<?xml version='1.0' encoding='UTF-8'?>\n"
+        text = SAMPLE.replace(
+            "<results preview='0'>", decl + "<results preview='0'>")
+        self.assertEqual(self.check(text), self.check(SAMPLE))
+
+        # .. and declarations may be split across reads
+        stream = results.XMLStream(StringIO(text))
+        chunks = []
+        while True:
+            chunk = stream.read(5)
+            if not chunk: break
+            chunks.append(chunk)
+        body = text[len(decl):].replace(decl, "\n")
+        self.assertEqual("".join(chunks), "\n<doc>%s</doc>\n" % body)
+
+        # Declarations within the results are left as they are
+        raw = "<?xml version='1.0'?><event/>"
+        event = SAMPLE.replace("<![CDATA[<z>]]>", "<![CDATA[%s]]>" % raw)
+        text = event.replace(
+            "<results preview='0'>", decl + "<results preview='0'>")
+        items = self.check(text)
+        self.assertTrue(items[2][1]['_raw'].endswith(
+            "&lt;?xml version='1.0'?&gt;&lt;event/&gt;</v>"))
+        stream = results.XMLStream(StringIO(text))
+        chunks = []
+        while True:
+            chunk = stream.read(5)
+            if not chunk: break
+            chunks.append(chunk)
+        self.assertTrue(raw in "".join(chunks))
+
+    def test_iteration(self):
+        reader = results.ExpatResultsReader(StringIO(SAMPLE))
+        self.assertEqual(len(list(reader)), 6)
+
+    def test_json(self):
+        items = readall(results.JSONResultsReader(ChunkStream(SAMPLE_JSON)))
+        kinds = [kind for kind, _, _ in items]
+        self.assertEqual(kinds, [
+            results.RESULTS, results.MESSAGE, results.RESULT, 
+            results.RESULT, results.RESULTS, results.RESULT, results.RESULT])
+        self.assertEqual(items[0][1], {'preview': '0'})
+        self.assertEqual(items[0][2], ['a', 'b'])
+        self.assertEqual(items[1][1], {'type': "INFO", 'message': "hello"})
+        self.assertEqual(items[2][1], {'a': "1", 'b': ["x", "y"], '$offset': "0"})
+        self.assertEqual(items[3][1], {'a': "\xc3\xa9", 'b': "", '$offset': "1"})
+        self.assertEqual(items[4][1], {'preview': '1'})
+        self.assertEqual(items[4][2], ['c'])
+        self.assertEqual(items[6][1], {'c': "4", '$offset': "1"})
+
+        # A results array, decoded one row at a time
+        text = '[{"a": "1"}, {"a": "2"}]'
+        reader = results.JSONResultsReader(ChunkStream(text, 3))
+        self.assertEqual(len(list(reader)), 3)
+        self.assertEqual(readall(results.JSONResultsReader(StringIO(""))), [])
+
+        # Numbers split across reads, in the export's row per line form
+        text = "".join(
+            '{"preview":false,"offset":%d,"result":{"n":"%d"}}\n' % (i, i)
+            for i in range(1000, 1300))
+        for size in (2, 7, 35, 8192):
+            items = readall(results.JSONResultsReader(ChunkStream(text, size)))
+            rows = [value for kind, value, _ in items if kind == results.RESULT]
+            self.assertEqual(len(rows), 300)
+            self.assertEqual(rows[-1], {'n': "1299", '$offset': "1299"})
+        text = '{"preview":false,"offset":1234,"result":{"n":"x"}}'
+        for split in range(1, len(text)):
+            stream = PartStream([text[:split], text[split:]])
+            items = readall(results.JSONResultsReader(stream))
+            self.assertEqual(items[-1][1], {'n': "x", '$offset': "1234"})
+
+        # The rows of a results section are read before the section ends
+        text = '{"preview": false, "fields": ["a"], "results": [{"a": "1"}, '
+        text += '{"a": "%s' % ("x" * 64)
+        reader = results.JSONResultsReader(TruncatedStream(text))
+        self.assertEqual(reader.read(), results.RESULTS)
+        self.assertEqual(reader.fields, ["a"])
+        self.assertEqual(reader.read(), results.RESULT)
+        self.assertEqual(reader.value, {'a': "1", '$offset': "0"})
+
+    def test_csv(self):
+        items = readall(results.CSVResultsReader(ChunkStream(SAMPLE_CSV)))
+        self.assertEqual([kind for kind, _, _ in items],
+            [results.RESULTS] + [results.RESULT] * 3)
+        self.assertEqual(items[0][2], ['a', 'b'])
+        self.assertEqual(items[1][1], {'a': "1", 'b': "x,y", '$offset': "0"})
+        self.assertEqual(items[2][1], {'a': "2", 'b': ["x", "$y"], '$offset': "1"})
+        self.assertEqual(items[3][1], {'a': "3\n4", 'b': "", '$offset': "2"})
+        self.assertEqual(readall(results.CSVResultsReader(StringIO(""))), [])
+
+        # A row that matches the header is data, and only a header after a
+        # blank line starts a new section
+        text = "a,b\r\n1,2\r\na,b\r\n\r\nc\r\n3\r\n"
+        items = readall(results.CSVResultsReader(StringIO(text)))
+        self.assertEqual([kind for kind, _, _ in items],
+            [results.RESULTS] + [results.RESULT] * 2 +
+            [results.RESULTS, results.RESULT])
+        self.assertEqual(items[2][1], {'a': "a", 'b': "b", '$offset': "1"})
+        self.assertEqual(items[4][1], {'c': "3", '$offset': "2"})
+
+    def test_batches(self):
+        text = "n,x,s\r\n1,0.5,a\r\n2,,b\r\n3.0,1.5,a\r\n"
+        reader = results.CSVResultsReader(StringIO(text))
+        batches = list(reader.read_batches(2, {'n': 'l', 'x': 'd'}))
+        self.assertEqual([batch.rows for batch in batches], [2, 1])
+        batch = batches[0]
+        self.assertEqual(sorted(batch.keys()), ['n', 's', 'x'])
+        self.assertEqual(batch['n'], array('l', [1, 2]))
+        self.assertEqual(batch['x'][0], 0.5)
+        self.assertTrue(math.isnan(batch['x'][1]))
+        self.assertEqual(batch['s'], ["a", "b"])
+        self.assertTrue(batches[1]['s'][0] is batch['s'][0]) # Interned
+        self.assertEqual(batches[1]['n'], array('l', [3]))
+
+        # Fields that some rows lack, and multi-valued fields
+        reader = results.JSONResultsReader(ChunkStream(SAMPLE_JSON))
+        batches = list(reader.read_batches(schema={'c': 'l'}))
+        self.assertEqual(len(batches), 1)
+        batch = batches[0]
+        self.assertEqual(batch.rows, 4)
+        self.assertEqual(batch['a'], ["1", "\xc3\xa9", None, None])
+        self.assertEqual(batch['b'], [["x", "y"], "", None, None])
+        self.assertEqual(batch['c'], array('l', [0, 0, 3, 4]))
+
+        reader = results.ResultsReader(StringIO(SAMPLE))
+        batches = list(reader.read_batches())
+        self.assertEqual(batches[0]['c'], [None, None, "3"])
+
+        # A non-numeric value in a numeric column names its field
+        reader = results.CSVResultsReader(StringIO(text))
+        try:
+            list(reader.read_batches(schema={'s': 'l'}))
+            self.fail("ValueError not raised")
+        except ValueError as e:
+            self.assertTrue("Field s " in str(e))
+
+        # As does one that overflows an integer column
+        for value in ["123456789012345678901", "inf"]:
+            reader = results.CSVResultsReader(StringIO("n\r\n%s\r\n" % value))
+            try:
+                list(reader.read_batches(schema={'n': 'l'}))
+                self.fail("ValueError not raised")
+            except ValueError as e:
+                self.assertTrue("Field n " in str(e))
+
+if __name__ == "__main__":
+    unittest.main()